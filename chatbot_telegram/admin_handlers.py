@@ -0,0 +1,179 @@
+import functools
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import CallbackContext, CallbackQueryHandler, CommandHandler
+
+from config import ADMIN_CHAT_IDS, engine
+from constants import AGE_BUCKET_OLDEST, AGE_BUCKETS, PREFERENCE_OPTIONS
+from replies import reply, respond
+import profiling
+import repository
+import search
+import stats
+
+
+def admin_only(handler):
+    # Admin commands are silently ignored outside ADMIN_CHAT_IDS
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: CallbackContext):
+        if update.effective_chat.id in ADMIN_CHAT_IDS:
+            return await handler(update, context)
+
+    return wrapper
+
+
+def parse_segment(line):
+    # "preference=2; school=Minerva University" -> {"preference_code": 2, ...}
+    segment = {}
+    for part in line.split(";"):
+        key, _, value = part.partition("=")
+        key, value = key.strip().lower(), value.strip()
+        if key == "preference" and value.isdecimal() and int(value) in PREFERENCE_OPTIONS:
+            segment["preference_code"] = int(value)
+        elif key == "school" and value:
+            segment["school"] = value
+        else:
+            raise ValueError(part.strip())
+    return segment
+
+
+@admin_only
+async def broadcast_command(update: Update, context: CallbackContext):
+    # /broadcast <text>, or a segment line followed by the text:
+    #   /broadcast preference=2; school=Minerva University
+    #   Mock SAT this Saturday!
+    body = update.message.text.partition(" ")[2].strip()
+    first_line, newline, rest = body.partition("\n")
+    segment = {}
+    if newline and "=" in first_line:
+        try:
+            segment = parse_segment(first_line)
+        except ValueError as e:
+            await reply(update, f"Unknown segment filter: {e}")
+            return
+        body = rest.strip()
+    if not body:
+        await reply(
+            update,
+            "Usage: /broadcast <message>, optionally preceded by a line such as\npreference=2; school=Minerva University",
+        )
+        return
+
+    import broadcast  # Only needed once an admin broadcasts
+
+    broadcast_id = await repository.run_in_db(broadcast.create_broadcast, body, **segment)
+    await reply(update, f"Broadcast {broadcast_id} started.")
+
+    async def run():
+        sent, failed = await broadcast.run_broadcast(context.bot, broadcast_id)
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id,
+            text=f"Broadcast {broadcast_id} finished: {sent} sent, {failed} failed.",
+        )
+
+    context.application.create_task(run(), update=update)
+
+
+@admin_only
+async def profile_command(update: Update, context: CallbackContext):
+    # /profile [seconds]: samples the whole bot and reports the hot spots
+    argument = update.message.text.partition(" ")[2].strip()
+    seconds = int(argument) if argument.isdecimal() else profiling.PROFILE_SECONDS
+    seconds = max(1, min(seconds, profiling.PROFILE_MAX_SECONDS))
+    await reply(update, f"Profiling for {seconds}s.")
+
+    async def run():
+        try:
+            report = await profiling.profile(seconds, engine)
+        except RuntimeError as e:
+            report = str(e)
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=report)
+
+    context.application.create_task(run(), update=update)
+
+
+SEARCH_MORE_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton("More", callback_data="search:more")]]
+)
+
+
+async def _show_search_page(update: Update, context: CallbackContext):
+    query, page = context.chat_data["search"]
+    users, more = await repository.run_in_db(search.search_users, query, page)
+    if not users:
+        await respond(update, f"No profiles match \"{query}\".")
+        return
+    first = (page - 1) * search.SEARCH_PAGE_SIZE + 1
+    lines = [f"Results {first}-{first + len(users) - 1} for \"{query}\":"]
+    for user in users:
+        bio = (user.bio or "")[:80]
+        lines.append(
+            f"{user.chat_id} {user.first_name} {user.last_name}, {user.school}: {bio}"
+        )
+    await respond(
+        update, "\n".join(lines), reply_markup=SEARCH_MORE_KEYBOARD if more else None
+    )
+
+
+@admin_only
+async def search_command(update: Update, context: CallbackContext):
+    # /search <words>: ranked matches in bios and school names
+    query = update.message.text.partition(" ")[2].strip()
+    if not search.search_terms(query):
+        await reply(update, "Usage: /search <words from a bio or school name>")
+        return
+    context.chat_data["search"] = (query, 1)
+    await _show_search_page(update, context)
+
+
+@admin_only
+async def search_more(update: Update, context: CallbackContext):
+    if "search" not in context.chat_data:
+        await update.callback_query.answer("Search again with /search.")
+        return
+    query, page = context.chat_data["search"]
+    context.chat_data["search"] = (query, page + 1)
+    await _show_search_page(update, context)
+
+
+def format_stats(counts):
+    lines = [f"Registered users: {counts['total']}", "", "Completed registrations:"]
+    lines += [f"{day}: {count}" for day, count in counts["days"]] or ["none recently"]
+    lines += ["", "By preference:"]
+    for code, count in sorted(counts["preference"].items()):
+        lines.append(f"{PREFERENCE_OPTIONS.get(int(code or 0), 'none')}: {count}")
+    lines += ["", "By age:"]
+    for label in [label for _, label in AGE_BUCKETS] + [AGE_BUCKET_OLDEST, "unknown"]:
+        if label in counts["age"]:
+            lines.append(f"{label}: {counts['age'][label]}")
+    lines += ["", "Top schools:"]
+    lines += [f"{school or 'none'}: {count}" for school, count in counts["schools"]]
+    return "\n".join(lines)
+
+
+@admin_only
+async def stats_command(update: Update, context: CallbackContext):
+    # /stats: registration counts; /stats repair: recount and fix drift
+    argument = update.message.text.partition(" ")[2].strip().lower()
+    if argument == "repair":
+        await reply(update, "Recounting registrations.")
+        drift = await repository.run_in_db(stats.repair_stats)
+        lines = [f"{len(drift)} counters had drifted and were fixed." if drift else "No drift."]
+        lines += [
+            f"{dimension} {bucket or 'none'}: {stored} -> {actual}"
+            for dimension, bucket, stored, actual in drift[:20]
+        ]
+        await reply(update, "\n".join(lines))
+        return
+    counts = await repository.run_in_db(stats.read_stats)
+    await reply(update, format_stats(counts))
+
+
+def get_admin_handlers():
+    return [
+        CommandHandler("broadcast", broadcast_command),
+        CommandHandler("profile", profile_command),
+        CommandHandler("search", search_command),
+        CommandHandler("stats", stats_command),
+        CallbackQueryHandler(search_more, pattern="^search:more$"),
+    ]
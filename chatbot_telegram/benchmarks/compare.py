@@ -0,0 +1,57 @@
+# Compares two result files from benchmarks.micro and flags every benchmark
+# whose median got slower than the baseline by more than the threshold.
+#
+#   cd chatbot_telegram
+#   python -m benchmarks.compare before.json after.json --threshold 10
+#
+# Exits with status 1 when anything regressed, so it can gate CI.
+import argparse
+import json
+import sys
+
+
+def compare(baseline, current, threshold):
+    # Returns (name, baseline median, current median, ratio, regressed) rows
+    rows = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        ratio = result["median_us"] / before["median_us"]
+        rows.append(
+            (name, before["median_us"], result["median_us"], ratio, ratio > 1 + threshold / 100)
+        )
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument(
+        "--threshold", type=float, default=20.0, help="Allowed slowdown in percent"
+    )
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold)
+    for name, before, after, ratio, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:>36}: {before:10.1f}us -> {after:10.1f}us ({ratio - 1:+7.1%}){flag}")
+    missing = sorted(set(baseline["results"]) - set(current["results"]))
+    if missing:
+        print(f"Not in current run: {', '.join(missing)}")
+
+    regressions = [row for row in rows if row[4]]
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:g}%")
+        sys.exit(1)
+    print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import random
+import sqlite3
+
+from config import create_db_engine
+from constants import PREFERENCE_OPTIONS
+from models import initialize_database
+
+SCHOOLS = [f"School {i}" for i in range(2000)]
+FIRST_CHAT_ID = 100000000
+
+BIO_WORDS = (
+    "maths physics chemistry biology history art music band chess robotics "
+    "debate soccer basketball volunteering coding writing poetry theatre "
+    "economics medicine engineering law design photography languages"
+).split()
+
+
+def generate_users(path, users, seed=0):
+    # Creates the current schema at path and fills it with generated users
+    engine = create_db_engine(f"sqlite:///{path}", "default")
+    initialize_database(engine)
+    engine.dispose()
+
+    rng = random.Random(seed)
+    codes = list(PREFERENCE_OPTIONS)
+    rows = (
+        (
+            FIRST_CHAT_ID + i,
+            "First",
+            "Last",
+            rng.randint(14, 25),
+            rng.choice(SCHOOLS),
+            f"student{i}@example.com",
+            "I enjoy " + " and ".join(rng.sample(BIO_WORDS, 3)) + ".",
+            rng.choice(codes),
+        )
+        for i in range(users)
+    )
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executemany(
+        "INSERT INTO users (chat_id, first_name, last_name, age, school, email, bio, preference_code) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    connection.commit()
+    connection.close()
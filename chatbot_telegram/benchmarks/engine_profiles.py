@@ -0,0 +1,47 @@
+# Compares single-row commit throughput for each engine profile in config.py.
+#
+#   cd chatbot_telegram && python -m benchmarks.engine_profiles --rows 2000
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.orm import sessionmaker
+
+from config import ENGINE_PROFILES, create_db_engine
+from models import User, initialize_database
+
+
+def _write(session_factory, chat_ids):
+    for chat_id in chat_ids:
+        session = session_factory()
+        session.add(User(chat_id=chat_id, first_name="Bench", bio="x" * 200))
+        session.commit()
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    for profile in ENGINE_PROFILES:
+        if profile == "server":
+            continue  # Pool settings only matter for server databases
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", profile)
+            initialize_database(engine)
+            session_factory = sessionmaker(bind=engine)
+            chunks = [range(i, args.rows, args.threads) for i in range(args.threads)]
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.threads) as pool:
+                list(pool.map(lambda chunk: _write(session_factory, chunk), chunks))
+            elapsed = time.perf_counter() - started
+            engine.dispose()
+        print(f"{profile:>10}: {args.rows / elapsed:8.0f} commits/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+# Exports a generated users database in every format and reports throughput
+# and peak memory. Each export runs in its own process so peak RSS is not
+# shared between runs.
+#
+#   cd chatbot_telegram && python -m benchmarks.export_rows --users 1000000
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.datasets import generate_users
+
+CHILD = """
+import resource, sys
+from export import export
+rows, elapsed = export(sys.argv[1], sys.argv[2])
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+print(rows, elapsed, peak)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.db")
+        started = time.perf_counter()
+        generate_users(path, args.users)
+        print(f"generated {args.users} users in {time.perf_counter() - started:.1f}s")
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}")
+        for fmt in ("csv", "jsonl", "parquet"):
+            output = os.path.join(tmp, f"users.{fmt}")
+            result = subprocess.run(
+                [sys.executable, "-c", CHILD, fmt, output],
+                env=env,
+                capture_output=True,
+                text=True,
+            )
+            if result.returncode:
+                print(f"{fmt:>8}: failed: {result.stderr.strip().splitlines()[-1]}")
+                continue
+            rows, elapsed, peak = result.stdout.split()
+            print(
+                f"{fmt:>8}: {int(rows) / float(elapsed):9.0f} rows/s "
+                f"peak RSS={float(peak):.0f}MiB size={os.path.getsize(output) / 2**20:.0f}MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from state_store import Draft
+
+
+# Minimal stand-ins for telegram.Update / CallbackContext. Handlers only touch
+# update.message.text, update.message.reply_text, update.callback_query and
+# update.effective_chat.id, so plain objects are enough to drive them without
+# a network or a real bot.
+class FakeMessage:
+    def __init__(self, chat_id, text, replies, network_delay=0.0):
+        self.chat_id = chat_id
+        self.text = text
+        self._replies = replies
+        self._network_delay = network_delay
+
+    async def reply_text(self, text, **kwargs):
+        self._replies.append((self.chat_id, time.perf_counter(), text))
+        await asyncio.sleep(self._network_delay)  # Simulated Bot API round trip
+
+
+class FakeCallbackQuery:
+    def __init__(self, chat_id, data, replies):
+        self.chat_id = chat_id
+        self.data = data
+        self._replies = replies
+
+    async def answer(self, *args, **kwargs):
+        pass
+
+    async def edit_message_text(self, text, **kwargs):
+        self._replies.append((self.chat_id, time.perf_counter(), text))
+
+
+def make_update(chat_id, text, replies, network_delay=0.0):
+    return SimpleNamespace(
+        message=FakeMessage(chat_id, text, replies, network_delay),
+        callback_query=None,
+        effective_chat=SimpleNamespace(id=chat_id),
+    )
+
+
+def make_callback_update(chat_id, data, replies):
+    # A button press on a message the bot sent earlier
+    return SimpleNamespace(
+        message=FakeMessage(chat_id, None, replies),
+        callback_query=FakeCallbackQuery(chat_id, data, replies),
+        effective_chat=SimpleNamespace(id=chat_id),
+    )
+
+
+def make_context(user_data=None):
+    return SimpleNamespace(user_data=Draft() if user_data is None else user_data)
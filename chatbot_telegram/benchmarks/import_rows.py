@@ -0,0 +1,44 @@
+# Imports a generated CSV of registrations (with a share of invalid rows)
+# into an empty database and reports the time taken.
+#
+#   cd chatbot_telegram && python -m benchmarks.import_rows --rows 100000
+import argparse
+import csv
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.datasets import SCHOOLS
+
+
+def _write_csv(path, rows):
+    rng = random.Random(0)
+    with open(path, "w", newline="") as output:
+        writer = csv.writer(output)
+        writer.writerow(
+            ["chat_id", "first_name", "last_name", "email", "age", "school", "preferences", "bio"]
+        )
+        for i in range(rows):
+            email = f"student{i}@example.com" if rng.random() > 0.02 else "not-an-email"
+            writer.writerow(
+                [200000000 + i, "ada", "lovelace", email, rng.randint(14, 25),
+                 rng.choice(SCHOOLS), rng.randint(1, 4), "Signed up at a school fair."]
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "signups.csv")
+        _write_csv(path, args.rows)
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'users.db')}")
+        subprocess.run([sys.executable, "import_users.py", path], env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
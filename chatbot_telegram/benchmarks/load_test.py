@@ -0,0 +1,206 @@
+# Offline load test: thousands of virtual users register and edit their
+# profiles through the real Application and ConversationHandler, with the
+# fake Bot API standing in for Telegram.
+#
+#   cd chatbot_telegram && python -m benchmarks.load_test --users 2000
+#
+# Each virtual user sends its next update only after the bot replied to the
+# previous one, like a person would. Reported per step: reply latency
+# percentiles; for the database: time spent waiting for a repository worker
+# (contention) and executing, and profile writes from submission to commit.
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+# Measure the bot, not the outbound or inbound flood limits
+os.environ.setdefault("OUTBOUND_CHAT_RATE", "1000000")
+os.environ.setdefault("OUTBOUND_CHAT_BURST", "1000000")
+os.environ.setdefault("OUTBOUND_GLOBAL_RATE", "1000000")
+os.environ.setdefault("FLOOD_CHAT_RATE", "1000000")
+os.environ.setdefault("FLOOD_CHAT_BURST", "1000000")
+os.environ.setdefault("FLOOD_DUPLICATE_WINDOW", "0")
+
+from telegram import Update
+
+from fake_telegram import find_button, make_callback_update, make_message_update
+
+FIRST_CHAT_ID = 500000000
+STEP_TIMEOUT = 30
+
+REGISTRATION = [
+    ("start", "/start"),
+    ("first_name", "ada"),
+    ("last_name", "lovelace"),
+    ("email", "ada@example.com"),
+    ("age", "17"),
+    ("school", "Minerva University"),
+    ("preferences", "2"),
+    ("bio", "I like maths."),
+]
+
+EDITS = {
+    "first name": "grace",
+    "last name": "hopper",
+    "email": "grace@example.com",
+    "age": "18",
+    "school": "MIT",
+    "bio": "I like compilers.",
+    "preferences": "3",
+}
+
+
+def _percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+class Harness:
+    def __init__(self, application, request):
+        self.application = application
+        self.request = request
+        self.latencies = defaultdict(list)
+        self.timeouts = 0
+
+    async def send(self, chat_id, step, text):
+        # Taps the matching button when the last reply offered one
+        message, markup = self.request.last_messages.get(chat_id, (None, None))
+        data = find_button(markup, text)
+        if data is not None:
+            payload = make_callback_update(chat_id, message, data)
+        else:
+            payload = make_message_update(chat_id, text)
+        reply = self.request.wait_for_reply(chat_id)
+        started = time.perf_counter()
+        await self.application.update_queue.put(
+            Update.de_json(payload, self.application.bot)
+        )
+        try:
+            await asyncio.wait_for(reply, STEP_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return
+        self.latencies[step].append(time.perf_counter() - started)
+
+    async def virtual_user(self, chat_id, rng, max_edits):
+        for step, text in REGISTRATION:
+            await self.send(chat_id, step, text)
+        for field in rng.sample(list(EDITS), rng.randint(0, max_edits)):
+            await self.send(chat_id, "update", "/update")
+            await self.send(chat_id, "update_choice", field)
+            await self.send(chat_id, f"update_{field.replace(' ', '_')}", EDITS[field])
+            await self.send(chat_id, "update_done", "done")
+
+
+def _instrument_repository():
+    # Splits every repository call into queue wait and execution time, and
+    # times profile writes through the writer thread as a whole
+    import repository
+
+    timings = {"wait": [], "run": [], "write": []}
+    original = repository.run_in_db
+    original_writes = repository.run_writes
+
+    async def timed_run_in_db(func, *args, **kwargs):
+        submitted = time.perf_counter()
+        started = []
+
+        def run():
+            started.append(time.perf_counter())
+            return func(*args, **kwargs)
+
+        try:
+            return await original(run)
+        finally:
+            if started:
+                timings["wait"].append(started[0] - submitted)
+                timings["run"].append(time.perf_counter() - started[0])
+
+    async def timed_run_writes(statements):
+        submitted = time.perf_counter()
+        try:
+            return await original_writes(statements)
+        finally:
+            timings["write"].append(time.perf_counter() - submitted)
+
+    repository.run_in_db = timed_run_in_db
+    repository.run_writes = timed_run_writes
+    return timings
+
+
+async def _run(args):
+    from bot import build_application
+
+    application = build_application(fake_api=True)
+    request = application.bot._request[1]
+    request.latency = args.api_latency_ms / 1000
+    harness = Harness(application, request)
+    timings = _instrument_repository()
+    rng = random.Random(0)
+
+    async with application:
+        await application.start()
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def user(index):
+            async with semaphore:
+                await harness.virtual_user(FIRST_CHAT_ID + index, rng, args.max_edits)
+
+        await asyncio.gather(*(user(i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+        await application.stop()
+
+    from sqlalchemy import func, select
+
+    from config import Session
+    from models import User
+
+    registered = Session().execute(select(func.count()).select_from(User)).scalar()
+    Session.remove()
+    total = sum(len(values) for values in harness.latencies.values())
+    print(
+        f"{args.users} users ({registered} registered), {total} updates in {elapsed:.1f}s "
+        f"({total / elapsed:.0f} updates/s), {harness.timeouts} timeouts"
+    )
+    print(f"{'step':>22} {'count':>7} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)")
+    for step, values in harness.latencies.items():
+        values.sort()
+        print(
+            f"{step:>22} {len(values):7d} {_percentile(values, 50):8.1f} "
+            f"{_percentile(values, 95):8.1f} {_percentile(values, 99):8.1f}"
+        )
+    for label, values in (
+        ("db wait", timings["wait"]),
+        ("db run", timings["run"]),
+        ("db write", timings["write"]),
+    ):
+        values.sort()
+        if values:
+            print(
+                f"{label:>22} {len(values):7d} {_percentile(values, 50):8.1f} "
+                f"{_percentile(values, 95):8.1f} {_percentile(values, 99):8.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=500, help="Users active at once")
+    parser.add_argument("--max-edits", type=int, default=3)
+    parser.add_argument("--api-latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'load.db')}"
+        from config import engine
+        from models import initialize_database
+
+        initialize_database(engine)
+        asyncio.run(_run(args))
+
+
+if __name__ == "__main__":
+    main()
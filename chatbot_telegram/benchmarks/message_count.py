@@ -0,0 +1,84 @@
+# Walks one scripted registration plus two profile edits through the real
+# Application against the fake Bot API and counts the traffic it causes.
+# Where the bot shows inline buttons the virtual user taps the matching one;
+# otherwise it types, including the typos listed in FLOW.
+#
+#   cd chatbot_telegram && python -m benchmarks.message_count
+import asyncio
+import os
+import tempfile
+
+# The count should not wait on the outbound limiter, and the scripted user
+# types faster than the inbound flood guard lets a person
+os.environ.setdefault("OUTBOUND_CHAT_RATE", "1000")
+os.environ.setdefault("OUTBOUND_CHAT_BURST", "1000")
+os.environ.setdefault("OUTBOUND_GLOBAL_RATE", "1000")
+os.environ.setdefault("FLOOD_CHAT_RATE", "1000000")
+os.environ.setdefault("FLOOD_CHAT_BURST", "1000000")
+os.environ.setdefault("FLOOD_DUPLICATE_WINDOW", "0")
+
+from telegram import Update
+
+from fake_telegram import find_button, make_callback_update, make_message_update
+
+CHAT_ID = 4242
+
+# Each step lists what the user types, in order; all but the last are typos
+# that only happen when there is no button to tap.
+FLOW = [
+    ["/start"],
+    ["ada"],
+    ["lovelace"],
+    ["ada@example.com"],
+    ["17"],
+    ["Minerva University"],
+    ["5", "2"],
+    ["I like maths."],
+    ["/update"],
+    ["preference", "preferences"],
+    ["7", "3"],
+    ["school"],
+    ["MIT"],
+    ["done"],
+]
+
+
+async def _run():
+    from bot import build_application
+
+    application = build_application(fake_api=True)
+    request = application.bot._request[1]
+    inbound = 0
+    async with application:
+        for attempts in FLOW:
+            message, markup = request.last_messages.get(CHAT_ID, (None, None))
+            data = find_button(markup, attempts[-1])
+            if data is not None:
+                payloads = [make_callback_update(CHAT_ID, message, data)]
+            else:
+                payloads = [make_message_update(CHAT_ID, text) for text in attempts]
+            for payload in payloads:
+                inbound += 1
+                await application.process_update(Update.de_json(payload, application.bot))
+        await application.persistence.flush()
+
+    methods = [method for method, _, _ in request.calls]
+    api_calls = sum(m not in ("getMe", "getUpdates") for m in methods)
+    print(
+        f"inbound updates={inbound} messages sent={methods.count('sendMessage')} "
+        f"edits={methods.count('editMessageText')} api calls={api_calls}"
+    )
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        from config import engine
+        from models import initialize_database
+
+        initialize_database(engine)
+        asyncio.run(_run())
+
+
+if __name__ == "__main__":
+    main()
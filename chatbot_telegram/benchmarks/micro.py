@@ -0,0 +1,257 @@
+# Micro-benchmarks for the hot paths: every conversation handler driven with
+# fake updates, the user lookup by chat_id, is_valid_email on hostile input,
+# engine creation and module import time. Results are written as JSON so two
+# runs can be compared with benchmarks.compare.
+#
+#   cd chatbot_telegram
+#   python -m benchmarks.micro --output before.json
+#   python -m benchmarks.micro --output after.json
+#   python -m benchmarks.compare before.json after.json
+#
+# Every benchmark reports per-call times in microseconds over --runs samples.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+from config import ENGINE_PROFILES, Session, create_db_engine
+from email_utils import is_valid_email
+from models import initialize_database
+import handlers
+import repository
+from state_store import Draft
+from benchmarks.fakes import make_callback_update, make_context, make_update
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REGISTERED_CHAT = 1
+NEW_CHAT = 2
+BIO_CHAT = 3  # bio() registers its chat, so it gets one of its own
+
+DRAFT = {
+    "first_name": "Ada",
+    "last_name": "Lovelace",
+    "email": "ada@example.com",
+    "age": 17,
+    "school": "Minerva University",
+    "preference_code": 2,
+}
+
+# (name, handler, chat, input, is a button press)
+HANDLER_CASES = [
+    ("start/new", handlers.start, NEW_CHAT, "/start", False),
+    ("start/returning", handlers.start, REGISTERED_CHAT, "/start", False),
+    ("first_name", handlers.first_name, NEW_CHAT, "ada", False),
+    ("last_name", handlers.last_name, NEW_CHAT, "lovelace", False),
+    ("email/valid", handlers.email, NEW_CHAT, "ada@example.com", False),
+    ("email/invalid", handlers.email, NEW_CHAT, "ada@example", False),
+    ("age", handlers.age, NEW_CHAT, "17", False),
+    ("school", handlers.school, NEW_CHAT, "Minerva University", False),
+    ("school/suggest", handlers.school, NEW_CHAT, "Harverd Univ", False),
+    ("school/button", handlers.school, NEW_CHAT, "school:2", True),
+    ("preferences/typed", handlers.preferences, NEW_CHAT, "2", False),
+    ("preferences/button", handlers.preferences, NEW_CHAT, "pref:2", True),
+    ("bio", handlers.bio, BIO_CHAT, "I like maths.", False),
+    ("update", handlers.update, REGISTERED_CHAT, "/update", False),
+    ("update_choice/button", handlers.update_choice, REGISTERED_CHAT, "update:email", True),
+    ("update_first_name", handlers.update_first_name, REGISTERED_CHAT, "grace", False),
+    ("update_last_name", handlers.update_last_name, REGISTERED_CHAT, "hopper", False),
+    ("update_email", handlers.update_email, REGISTERED_CHAT, "grace@example.com", False),
+    ("update_age", handlers.update_age, REGISTERED_CHAT, "18", False),
+    ("update_school", handlers.update_school, REGISTERED_CHAT, "MIT", False),
+    ("update_preferences/button", handlers.update_preferences, REGISTERED_CHAT, "pref:3", True),
+    ("update_bio", handlers.update_bio, REGISTERED_CHAT, "I like compilers.", False),
+    ("cancel", handlers.cancel, REGISTERED_CHAT, "/cancel", False),
+]
+
+# Telegram caps a message at 4096 characters, so that bounds what a user can
+# make the email regex chew on
+EMAIL_INPUTS = {
+    "valid": "ada.lovelace+getin@example.co.uk",
+    "no_at": "a" * 4096,
+    "many_at": "@" * 4096,
+    "long_local": "a." * 2040 + "@example.com!",
+    "long_domain": "a@" + "a-" * 2040 + ".com!",
+    "dotted_tld": "a@example." + "." * 4080 + "!",
+}
+
+IMPORT_MODULES = ["handlers", "conversation_handlers", "bot"]
+IMPORT_PROBE = (
+    "import time; started = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - started)"
+)
+
+
+def _summary(samples):
+    # Per-call seconds -> microseconds
+    ordered = sorted(sample * 1e6 for sample in samples)
+    return {
+        "runs": len(ordered),
+        "min_us": ordered[0],
+        "median_us": statistics.median(ordered),
+        "p99_us": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+        "mean_us": statistics.fmean(ordered),
+    }
+
+
+def _make(chat_id, text, button, replies):
+    if button:
+        return make_callback_update(chat_id, text, replies)
+    return make_update(chat_id, text, replies)
+
+
+async def _bench_handler(handler, chat_id, text, button, runs, number):
+    replies = []
+    samples = []
+    # Warm-up call: fills the profile cache and the connection pool
+    await handler(_make(chat_id, text, button, replies), make_context(Draft(**DRAFT)))
+    for _ in range(runs):
+        calls = [
+            (_make(chat_id, text, button, replies), make_context(Draft(**DRAFT)))
+            for _ in range(number)
+        ]
+        started = time.perf_counter()
+        for update, context in calls:
+            await handler(update, context)
+        samples.append((time.perf_counter() - started) / number)
+        replies.clear()
+    return _summary(samples)
+
+
+async def bench_handlers(runs, number):
+    results = {}
+    for name, handler, chat_id, text, button in HANDLER_CASES:
+        results[f"handler.{name}"] = await _bench_handler(
+            handler, chat_id, text, button, runs, number
+        )
+    return results
+
+
+def bench_user_lookup(runs, users):
+    chat_ids = list(range(REGISTERED_CHAT, REGISTERED_CHAT + users))
+    random.seed(0)
+    probes = iter(random.choices(chat_ids, k=runs * 100 + 1))
+    timer = timeit.Timer(lambda: repository._get_user(next(probes)))
+    samples = [total / 100 for total in timer.repeat(repeat=runs, number=100)]
+    return {"storage.user_lookup": _summary(samples)}
+
+
+def bench_email(runs):
+    results = {}
+    for name, text in EMAIL_INPUTS.items():
+        timer = timeit.Timer(lambda: is_valid_email(text))
+        number, _ = timer.autorange()
+        samples = [total / number for total in timer.repeat(repeat=runs, number=number)]
+        results[f"email.{name}"] = _summary(samples)
+    return results
+
+
+def bench_engines(runs, tmp):
+    # Creation plus the first connection, which is where the pragmas run
+    results = {}
+    for profile in ENGINE_PROFILES:
+        if profile == "server":
+            continue  # Needs a server database
+        url = f"sqlite:///{os.path.join(tmp, f'engine-{profile}.db')}"
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            engine = create_db_engine(url, profile)
+            with engine.connect():
+                pass
+            samples.append(time.perf_counter() - started)
+            engine.dispose()
+        results[f"engine.{profile}"] = _summary(samples)
+    return results
+
+
+def bench_imports(runs, tmp):
+    # Each sample is a fresh interpreter, so nothing is cached in sys.modules
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'import.db')}")
+    results = {}
+    for module in IMPORT_MODULES:
+        samples = []
+        for _ in range(runs):
+            output = subprocess.run(
+                [sys.executable, "-c", IMPORT_PROBE.format(module=module)],
+                cwd=PACKAGE_DIR,
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            samples.append(float(output.split()[-1]))
+        results[f"import.{module}"] = _summary(samples)
+    return results
+
+
+def run(runs, number, users, only=None):
+    selected = lambda group: only is None or group in only
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        initialize_database(engine)
+        Session.configure(bind=engine)
+        repository.execute_writes(
+            [
+                repository.upsert_statement(chat_id, **DRAFT, bio="")
+                for chat_id in range(REGISTERED_CHAT, REGISTERED_CHAT + users)
+                if chat_id not in (NEW_CHAT, BIO_CHAT)
+            ]
+        )
+
+        if selected("handler"):
+            results.update(asyncio.run(bench_handlers(runs, number)))
+        if selected("storage"):
+            results.update(bench_user_lookup(runs, users))
+        if selected("email"):
+            results.update(bench_email(runs))
+        if selected("engine"):
+            results.update(bench_engines(runs, tmp))
+        if selected("import"):
+            results.update(bench_imports(min(runs, 10), tmp))
+        engine.dispose()
+    repository.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--number", type=int, default=50, help="Handler calls per run")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument(
+        "--only",
+        nargs="+",
+        choices=["handler", "storage", "email", "engine", "import"],
+    )
+    args = parser.parse_args()
+
+    results = run(args.runs, args.number, args.users, args.only)
+    for name, result in results.items():
+        print(
+            f"{name:>36}: median={result['median_us']:10.1f}us "
+            f"p99={result['p99_us']:10.1f}us"
+        )
+    if args.output:
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.time(),
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
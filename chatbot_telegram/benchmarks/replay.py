@@ -0,0 +1,166 @@
+# Replays an update log written by recorder.py through the real Application
+# against the fake Bot API, then compares reply transcripts and timing with
+# a baseline.
+#
+#   cd chatbot_telegram
+#   python -m benchmarks.replay updates.log --speed max --save baseline.json
+#   python -m benchmarks.replay updates.log --speed 10 --baseline baseline.json
+#
+# --speed 1 keeps the recorded gaps between updates, 10 shrinks them ten
+# times and max sends updates as fast as the bot accepts them. Chats are
+# replayed concurrently, but within a chat an update is only sent once the
+# previous one has been handled, so each reply is timed against the update
+# that caused it.
+import argparse
+import asyncio
+import functools
+import json
+import os
+import tempfile
+import time
+from collections import defaultdict
+
+os.environ.setdefault("OUTBOUND_CHAT_RATE", "1000000")
+os.environ.setdefault("OUTBOUND_CHAT_BURST", "1000000")
+os.environ.setdefault("OUTBOUND_GLOBAL_RATE", "1000000")
+os.environ.setdefault("FLOOD_CHAT_RATE", "1000000")
+os.environ.setdefault("FLOOD_CHAT_BURST", "1000000")
+os.environ.setdefault("FLOOD_DUPLICATE_WINDOW", "0")
+
+from telegram import Update
+
+from fake_telegram import make_callback_update, make_message_update
+from recorder import read_records
+
+REGRESSION_THRESHOLD = 1.2  # Flag p50/p99 more than 20% above baseline
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+async def _replay(path, speed):
+    from bot import build_application
+
+    application = build_application(fake_api=True)
+    request = application.bot._request[1]
+    latencies = []
+    chats = defaultdict(list)  # chat id -> [(offset, record)] in recorded order
+    for offset, record in read_records(path):
+        chats[record["c"]].append((offset, record))
+
+    def on_reply(future, started):
+        if not future.cancelled():
+            latencies.append(time.perf_counter() - started)
+
+    async def play(chat_id, records):
+        for offset, record in records:
+            if speed != "max":
+                delay = replay_started + offset / float(speed) - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if record["k"] == "c":
+                # Handlers only need the chat of the message a button was on
+                message = {
+                    "message_id": 0,
+                    "date": 0,
+                    "chat": {"id": chat_id, "type": "private"},
+                }
+                payload = make_callback_update(chat_id, message, record["x"])
+            else:
+                payload = make_message_update(chat_id, record["x"])
+            update = Update.de_json(payload, application.bot)
+            reply = request.wait_for_reply(chat_id)
+            reply.add_done_callback(functools.partial(on_reply, started=time.perf_counter()))
+            # What the Application does with each update taken off its queue;
+            # returning means the update has been handled
+            await application.update_processor.process_update(
+                update, application.process_update(update)
+            )
+            reply.cancel()  # No reply (e.g. a stale button); the next update gets its own
+
+    async with application:
+        await application.start()
+        replay_started = time.perf_counter()
+        await asyncio.gather(*(play(chat_id, records) for chat_id, records in chats.items()))
+        elapsed = time.perf_counter() - replay_started
+        await application.stop()
+
+    transcripts = defaultdict(list)
+    for method, parameters, _ in request.calls:
+        if method in ("sendMessage", "editMessageText"):
+            transcripts[str(parameters["chat_id"])].append(parameters.get("text", ""))
+    latencies.sort()
+    return {
+        "updates": sum(map(len, chats.values())),
+        "elapsed": elapsed,
+        "p50_ms": _percentile(latencies, 50),
+        "p99_ms": _percentile(latencies, 99),
+        "transcripts": transcripts,
+    }
+
+
+def compare(result, baseline):
+    # Returns a list of human-readable differences
+    problems = []
+    chats = set(result["transcripts"]) | set(baseline["transcripts"])
+    changed = sorted(
+        chat
+        for chat in chats
+        if result["transcripts"].get(chat) != baseline["transcripts"].get(chat)
+    )
+    if changed:
+        chat = changed[0]
+        ours = result["transcripts"].get(chat, [])
+        theirs = baseline["transcripts"].get(chat, [])
+        index = next(
+            (i for i, (a, b) in enumerate(zip(ours, theirs)) if a != b),
+            min(len(ours), len(theirs)),
+        )
+        problems.append(
+            f"{len(changed)} of {len(chats)} chat transcripts differ; first in chat "
+            f"{chat} at reply {index}: {theirs[index:index + 1]} -> {ours[index:index + 1]}"
+        )
+    for key in ("p50_ms", "p99_ms"):
+        if baseline[key] and result[key] > baseline[key] * REGRESSION_THRESHOLD:
+            problems.append(f"{key} regressed: {baseline[key]:.1f} -> {result[key]:.1f}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("log", help="File written with RECORD_UPDATES")
+    parser.add_argument("--speed", default="max", help="1, 10 or max")
+    parser.add_argument("--save", help="Write the result as a new baseline")
+    parser.add_argument("--baseline", help="Compare with a saved baseline")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'replay.db')}"
+        from config import engine
+        from models import initialize_database
+
+        initialize_database(engine)
+        result = asyncio.run(_replay(args.log, args.speed))
+
+    print(
+        f"{result['updates']} updates in {result['elapsed']:.1f}s, "
+        f"reply p50={result['p50_ms']:.1f}ms p99={result['p99_ms']:.1f}ms"
+    )
+    if args.save:
+        with open(args.save, "w") as output:
+            json.dump(result, output)
+    if args.baseline:
+        with open(args.baseline) as source:
+            problems = compare(result, json.load(source))
+        for problem in problems:
+            print(problem)
+        if problems:
+            raise SystemExit(1)
+        print("Matches baseline")
+
+
+if __name__ == "__main__":
+    main()
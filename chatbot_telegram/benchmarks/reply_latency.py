@@ -0,0 +1,97 @@
+# Measures reply latency for many concurrent chats, with database work either
+# run inline on the event loop (the old behaviour) or offloaded through the
+# repository executor. Chats that wait on the database ("db") and chats
+# whose steps never touch it ("no db") are also reported separately:
+# offloading is what lets the latter reply without queueing behind the
+# former, while the database work itself, mostly SQLAlchemy in Python,
+# still runs one thread at a time under the GIL.
+#
+#   cd chatbot_telegram && python -m benchmarks.reply_latency --chats 500
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from config import Session, create_db_engine
+from models import initialize_database
+import handlers
+import repository
+from benchmarks.fakes import make_context, make_update
+
+
+async def _inline(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+async def _inline_writes(statements):
+    return repository.execute_writes(statements)
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def _one_chat(chat_id, replies, delay):
+    # Registered users edit their bio and look themselves up; the others walk
+    # the first, database-free registration steps.
+    if chat_id % 2 == 0:
+        await handlers.update_bio(
+            make_update(chat_id, f"bio {chat_id}", replies, delay), make_context()
+        )
+        await handlers.start(
+            make_update(chat_id, "/start", replies, delay), make_context()
+        )
+    else:
+        context = make_context()
+        await handlers.first_name(make_update(chat_id, "ada", replies, delay), context)
+        await handlers.last_name(
+            make_update(chat_id, "lovelace", replies, delay), context
+        )
+
+
+async def _run(chats, delay):
+    # Every chat's update arrives at the same instant, so latency is measured
+    # from that shared arrival time to the chat's first reply.
+    replies = []
+    arrived = time.perf_counter()
+    await asyncio.gather(*(_one_chat(i, replies, delay) for i in range(chats)))
+    first_reply = {}
+    for chat_id, at, _ in replies:
+        first_reply.setdefault(chat_id, at)
+    return {chat_id: (at - arrived) * 1000 for chat_id, at in first_reply.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--network-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        initialize_database(engine)
+        Session.configure(bind=engine)
+        for chat_id in range(0, args.chats, 2):
+            repository._upsert_user(chat_id, first_name="Bench", bio="")
+
+        offloaded = repository.run_in_db, repository.run_writes
+        for label, runners in (("inline", (_inline, _inline_writes)), ("offloaded", offloaded)):
+            repository.run_in_db, repository.run_writes = runners
+            latencies = asyncio.run(_run(args.chats, args.network_ms / 1000))
+            for chats, values in (
+                ("all", list(latencies.values())),
+                ("db", [ms for chat_id, ms in latencies.items() if chat_id % 2 == 0]),
+                ("no db", [ms for chat_id, ms in latencies.items() if chat_id % 2]),
+            ):
+                print(
+                    f"{label:>10} {chats:>6}: p50={_percentile(values, 50):.1f}ms "
+                    f"p99={_percentile(values, 99):.1f}ms max={max(values):.1f}ms"
+                )
+        repository.run_in_db, repository.run_writes = offloaded
+    repository.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# Builds a legacy-schema database with generated users, then reports file
+# size and lookup latency before and after migrating to the compact schema.
+#
+#   cd chatbot_telegram && python -m benchmarks.schema_size --users 1000000
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from config import create_db_engine
+from constants import PREFERENCE_OPTIONS
+from models import initialize_database
+
+LEGACY_DDL = """
+CREATE TABLE users (
+    id INTEGER NOT NULL,
+    chat_id VARCHAR,
+    first_name VARCHAR,
+    last_name VARCHAR,
+    age INTEGER,
+    school VARCHAR,
+    email VARCHAR,
+    bio VARCHAR,
+    preferences VARCHAR,
+    PRIMARY KEY (id),
+    UNIQUE (chat_id)
+)
+"""
+
+SCHOOLS = [f"School {i}" for i in range(2000)]
+
+
+def _generate(path, users):
+    connection = sqlite3.connect(path)
+    connection.execute(LEGACY_DDL)
+    rng = random.Random(0)
+    options = list(PREFERENCE_OPTIONS.values())
+    rows = (
+        (
+            str(100000000 + i),
+            "First",
+            "Last",
+            rng.randint(14, 25),
+            rng.choice(SCHOOLS),
+            f"Student{i}@Example.com",
+            "I want to study computer science and play in the school band.",
+            rng.choice(options),
+        )
+        for i in range(users)
+    )
+    connection.executemany(
+        "INSERT INTO users (chat_id, first_name, last_name, age, school, email, bio, preferences) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    connection.commit()
+    connection.close()
+
+
+def _time_queries(connection, sql, params):
+    started = time.perf_counter()
+    for param in params:
+        connection.execute(sql, (param,)).fetchall()
+    return (time.perf_counter() - started) / len(params) * 1000
+
+
+def _report(label, path, users, legacy):
+    connection = sqlite3.connect(path)
+    rng = random.Random(1)
+    ids = [100000000 + rng.randrange(users) for _ in range(200)]
+    chat_ids = [str(i) for i in ids] if legacy else ids
+    emails = [f"student{i - 100000000}@example.com" for i in ids[:20]]
+    schools = [rng.choice(SCHOOLS) for _ in range(20)]
+    by_chat = _time_queries(connection, "SELECT * FROM users WHERE chat_id = ?", chat_ids)
+    by_email = _time_queries(
+        connection, "SELECT * FROM users WHERE lower(email) = ?", emails
+    )
+    by_school = _time_queries(
+        connection, "SELECT count(*) FROM users WHERE school = ?", schools
+    )
+    connection.close()
+    print(
+        f"{label:>7}: size={os.path.getsize(path) / 2**20:.1f}MiB "
+        f"chat_id={by_chat:.3f}ms lower(email)={by_email:.3f}ms school={by_school:.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.db")
+        _generate(path, args.users)
+        _report("before", path, args.users, legacy=True)
+
+        engine = create_db_engine(f"sqlite:///{path}", "default")
+        started = time.perf_counter()
+        initialize_database(engine)
+        engine.dispose()
+        migrated = time.perf_counter() - started
+        connection = sqlite3.connect(path)
+        connection.execute("VACUUM")  # Return the old table's pages
+        connection.close()
+        print(f"migrated in {migrated:.1f}s")
+        _report("after", path, args.users, legacy=False)
+
+
+if __name__ == "__main__":
+    main()
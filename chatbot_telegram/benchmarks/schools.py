@@ -0,0 +1,117 @@
+# Fuzzy school matching against a generated catalog: trigram index lookups
+# (SchoolCatalog.suggest) versus scoring every catalog entry.
+#
+#   cd chatbot_telegram && python -m benchmarks.schools --schools 20000
+import argparse
+import random
+import time
+
+from schools import SchoolCatalog, normalize, trigrams
+
+# Place names are made of these, as in "Oakbrook" or "Kelmarton"
+SYLLABLES = (
+    "ash bel bran brook carl dal den dun el fair field ford glen ham har "
+    "hol ken kel lan ley mar mil mont nor oak port ris ros sal ston ter "
+    "ton val ver wel wick win wood"
+).split()
+KINDS = [
+    "University of {}",
+    "{} State University",
+    "{} College",
+    "{} Institute of Technology",
+    "{} High School",
+    "{} Academy",
+]
+
+
+def generate_catalog(count, seed=0):
+    # (id, name, aliases) with distinct names such as "Oakbrook State University"
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < count:
+        place = "".join(rng.choices(SYLLABLES, k=rng.randint(2, 3))).title()
+        if rng.random() < 0.3:
+            place = f"{place} {''.join(rng.choices(SYLLABLES, k=2)).title()}"
+        names.add(rng.choice(KINDS).format(place))
+    rows = []
+    for school_id, name in enumerate(sorted(names), 1):
+        acronym = "".join(word[0] for word in name.split() if word[0].isupper())
+        rows.append((school_id, name, [acronym + str(school_id)]))
+    return rows
+
+
+def typo(name, rng):
+    # One dropped, doubled or swapped letter, and maybe different case
+    chars = list(name)
+    i = rng.randrange(1, len(chars) - 1)
+    change = rng.choice(["drop", "double", "swap"])
+    if change == "drop":
+        del chars[i]
+    elif change == "double":
+        chars.insert(i, chars[i])
+    else:
+        chars[i], chars[i + 1] = chars[i + 1], chars[i]
+    text = "".join(chars)
+    return text.lower() if rng.random() < 0.5 else text
+
+
+def scan(entries, text, limit=3, min_similarity=0.3):
+    # Baseline without the index: similarity against every entry
+    query = trigrams(normalize(text))
+    best = {}
+    for school_id, grams in entries:
+        shared = len(query & grams)
+        similarity = shared / (len(query) + len(grams) - shared)
+        if similarity >= min_similarity and similarity > best.get(school_id, 0):
+            best[school_id] = similarity
+    return sorted(best.items(), key=lambda item: -item[1])[:limit]
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--schools", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = generate_catalog(args.schools)
+    started = time.perf_counter()
+    catalog = SchoolCatalog(rows)
+    print(f"indexed {len(catalog)} schools in {time.perf_counter() - started:.2f}s")
+
+    rng = random.Random(1)
+    queries = [typo(rng.choice(rows)[1], rng) for _ in range(args.queries)]
+    timings = []
+    found = 0
+    for query in queries:
+        started = time.perf_counter()
+        matches = catalog.suggest(query)
+        timings.append((time.perf_counter() - started) * 1e6)
+        found += bool(matches)
+    p50, p99 = _percentiles(timings)
+    print(f"suggest      p50 {p50:8.0f}us  p99 {p99:8.0f}us  ({found}/{len(queries)} with suggestions)")
+
+    timings = []
+    for query in queries[:50]:
+        started = time.perf_counter()
+        catalog.canonicalize(query)
+        timings.append((time.perf_counter() - started) * 1e6)
+    p50, p99 = _percentiles(timings)
+    print(f"canonicalize p50 {p50:8.0f}us  p99 {p99:8.0f}us")
+
+    entries = catalog._entries
+    timings = []
+    for query in queries[:50]:
+        started = time.perf_counter()
+        scan(entries, query)
+        timings.append((time.perf_counter() - started) * 1e6)
+    p50, p99 = _percentiles(timings)
+    print(f"full scan    p50 {p50:8.0f}us  p99 {p99:8.0f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Query latency of search.search_users() over a generated users database,
+# against the LIKE '%...%' scan it replaces.
+#
+#   cd chatbot_telegram && python -m benchmarks.search --users 1000000
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import or_, select
+
+from benchmarks.datasets import generate_users
+from config import Session, create_db_engine
+from models import User
+import search
+
+QUERIES = [
+    ("one word", "robotics", 1),
+    ("two words", "chess poetry", 1),
+    ("prefix", "photo", 1),
+    ("school", "school 1234", 1),
+    ("deep page", "robotics", 50),
+    ("no match", "astrophysics", 1),
+]
+
+
+def _like(query, page_size=search.SEARCH_PAGE_SIZE):
+    session = Session()
+    try:
+        statement = select(User)
+        for term in search.search_terms(query):
+            pattern = f"%{term}%"
+            statement = statement.where(or_(User.bio.like(pattern), User.school.like(pattern)))
+        return session.scalars(statement.limit(page_size + 1)).all()
+    finally:
+        Session.remove()
+
+
+def _time(func, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "users.db")
+        started = time.perf_counter()
+        generate_users(path, args.users)
+        print(f"generated {args.users} users in {time.perf_counter() - started:.1f}s")
+        engine = create_db_engine(f"sqlite:///{path}")
+        Session.configure(bind=engine)
+
+        print(f"{'query':>10} {'matches':>8} {'fts p50':>9} {'fts p99':>9} {'like p50':>9}  (ms)")
+        for label, query, page in QUERIES:
+            users, _ = search.search_users(query, page)
+            fts_p50, fts_p99 = _time(lambda: search.search_users(query, page), args.runs)
+            like_p50, _ = _time(lambda: _like(query), max(1, args.runs // 10))
+            print(f"{label:>10} {len(users):8d} {fts_p50:9.2f} {fts_p99:9.2f} {like_p50:9.2f}")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
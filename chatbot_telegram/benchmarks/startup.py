@@ -0,0 +1,83 @@
+# Measures a cold start: the time from launching `python bot.py --fake-api`
+# until the bot sends its first getUpdates, i.e. is polling. Each sample is a
+# fresh interpreter; "fresh" starts from an empty database, "restart" from
+# one that is already at the current schema version.
+#
+#   cd chatbot_telegram && python -m benchmarks.startup --runs 10 --api-latency-ms 50
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs the real entry point and exits as soon as polling starts
+PROBE = """
+import os, sys
+import fake_telegram
+
+do_request = fake_telegram.FakeBotRequest.do_request
+
+async def probe(self, url, *args, **kwargs):
+    if url.endswith("/getUpdates"):
+        print("polling", flush=True)
+        os._exit(0)
+    return await do_request(self, url, *args, **kwargs)
+
+fake_telegram.FakeBotRequest.do_request = probe
+sys.argv = ["bot.py", "--fake-api"]
+import bot
+bot.main()
+"""
+
+
+def _start(env):
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", PROBE],
+        cwd=PACKAGE_DIR,
+        env=env,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    line = process.stdout.readline()
+    elapsed = time.perf_counter() - started
+    process.wait()
+    if line.strip() != "polling":
+        raise RuntimeError("The bot exited before it started polling")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--api-latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            FAKE_API_LATENCY_MS=str(args.api_latency_ms),
+            METRICS_PORT="0",
+            PROFILE_DIR=tmp,
+        )
+        restart_url = f"sqlite:///{os.path.join(tmp, 'restart.db')}"
+        _start(dict(env, DATABASE_URL=restart_url))  # Creates the schema
+        for label in ("fresh", "restart"):
+            samples = []
+            for run in range(args.runs):
+                url = restart_url
+                if label == "fresh":
+                    url = f"sqlite:///{os.path.join(tmp, f'fresh-{run}.db')}"
+                samples.append(_start(dict(env, DATABASE_URL=url)))
+            samples.sort()
+            print(
+                f"{label:>8}: median={samples[len(samples) // 2] * 1000:.0f}ms "
+                f"min={samples[0] * 1000:.0f}ms max={samples[-1] * 1000:.0f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
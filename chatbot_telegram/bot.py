@@ -1,14 +1,136 @@
-from telegram.ext import Application
+import argparse
+import asyncio
+
+from telegram import Update
+from telegram.ext import Application, ContextTypes, TypeHandler
+from admin_handlers import get_admin_handlers
 from config import TELEGRAM_BOT_TOKEN, engine
+from constants import SCHOOL, UPDATE_SCHOOL
+import metrics
 from conversation_handlers import get_conversation_handler
-from models import initialize_database
+from flood_guard import FloodGuard
+from persistence import SQLitePersistence
+import profiling
+from rate_limiter import TokenBucketRateLimiter
+from recorder import RECORD_UPDATES, UpdateRecorder
+import repository
+import schools
+from state_store import Draft
+from update_processor import PerChatUpdateProcessor
+from write_behind import WRITE_BEHIND_ENABLED, WriteBehindQueue
+
+
+async def post_init(application: Application):
+    if WRITE_BEHIND_ENABLED:
+        queue = repository.write_behind = WriteBehindQueue()
+        queue.start()
+        metrics.write_behind_pending.set_function(queue.pending)
+        metrics.write_behind_batches.set_function(lambda: queue.batches)
+        metrics.write_behind_rows.set_function(lambda: queue.rows)
+        metrics.write_behind_max_batch.set_function(lambda: queue.max_batch_size)
+        metrics.write_behind_failed.set_function(lambda: queue.failed)
+    if metrics.METRICS_PORT:
+        application.bot_data["metrics_server"] = await metrics.start_server()
+    if profiling.LOOP_LAG_THRESHOLD_MS:
+        application.bot_data["loop_lag_monitor"] = profiling.LoopLagMonitor()
+        application.bot_data["loop_lag_monitor"].start()
+    profiling.install_signal_handler(engine)
+    application.bot_data["conversation"].start(application)
+    await schools.run_in_matcher(schools.catalog)  # Build the trigram index off the event loop
+
+
+async def post_shutdown(application: Application):
+    await application.bot_data["conversation"].stop()
+    if "metrics_server" in application.bot_data:
+        application.bot_data["metrics_server"].close()
+    if "loop_lag_monitor" in application.bot_data:
+        await application.bot_data["loop_lag_monitor"].stop()
+    if repository.write_behind is not None:
+        await repository.write_behind.stop()  # Commit queued profile edits
+        repository.write_behind = None
+    if "recorder" in application.bot_data:
+        application.bot_data["recorder"].close()
+    repository.shutdown()  # Let in-flight database work finish
+
+
+def build_application(mode="polling", fake_api=False):
+    token = TELEGRAM_BOT_TOKEN
+    if not token:
+        if not fake_api:
+            raise RuntimeError("TELEGRAM_BOT_TOKEN is not set")
+        token = "0:offline"  # Never sent anywhere: the fake API answers every call
+    builder = (
+        Application.builder()
+        .token(token)
+        .context_types(ContextTypes(user_data=Draft))
+        .persistence(SQLitePersistence())
+        .concurrent_updates(PerChatUpdateProcessor())
+        .rate_limiter(TokenBucketRateLimiter())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if mode == "webhook":
+        from webhook import WEBHOOK_QUEUE_SIZE
+
+        # Updates arrive over HTTP; a bounded queue pushes back on Telegram
+        builder = builder.updater(None).update_queue(
+            asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+        )
+    if fake_api:
+        from fake_telegram import FakeBotRequest
+
+        builder = builder.request(FakeBotRequest()).get_updates_request(
+            FakeBotRequest()
+        )
+    application = builder.build()
+    metrics.update_queue_depth.set_function(application.update_queue.qsize)
+    metrics.updates_running.set_function(lambda: application.update_processor.running)
+    metrics.updates_waiting.set_function(lambda: application.update_processor.waiting)
+    conversation = get_conversation_handler()
+    application.bot_data["conversation"] = conversation
+    # Group -3 runs first, for every update; it notes who may hold a draft
+    application.add_handler(TypeHandler(Update, conversation.track_user), group=-3)
+    if RECORD_UPDATES:
+        # Group -2 sees every update, including those the flood guard drops.
+        # Answers to the school question are kept as typed.
+        recorder = UpdateRecorder(
+            RECORD_UPDATES,
+            keep_text=lambda update: conversation.state(update) in (SCHOOL, UPDATE_SCHOOL),
+        )
+        application.bot_data["recorder"] = recorder
+        application.add_handler(TypeHandler(Update, recorder.record), group=-2)
+    application.add_handler(TypeHandler(Update, FloodGuard().check), group=-1)
+    metrics.conversations.set_function(
+        lambda: {(state,): count for state, (count, _) in conversation.stats().items()}
+    )
+    metrics.conversation_bytes.set_function(
+        lambda: {(state,): size for state, (_, size) in conversation.stats().items()}
+    )
+    application.add_handler(conversation)
+    application.add_handlers(get_admin_handlers())
+    return application
+
 
 def main():
-    initialize_database(engine)  # Create database tables if they don't exist
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument(
+        "--fake-api",
+        action="store_true",
+        help="Answer Bot API calls locally, for offline load tests",
+    )
+    args = parser.parse_args()
+
+    metrics.instrument_engine(engine)
+    repository.start_schema_check(engine)  # Create or migrate the database schema
+
+    application = build_application(args.mode, args.fake_api)
+    if args.mode == "webhook":
+        from webhook import serve
 
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
-    application.add_handler(get_conversation_handler())
-    application.run_polling()
+        asyncio.run(serve(application))
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
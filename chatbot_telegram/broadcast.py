@@ -0,0 +1,182 @@
+# Sends one message to every registered user, or to a segment of them.
+#
+#   python broadcast.py --text "Applications close Friday!" [--preference 2] [--school "..."]
+#   python broadcast.py --resume 3
+#
+# Recipients are read in keyset pages (chat_id > checkpoint), so memory stays
+# flat and no read transaction is held open while messages go out. After
+# each page the delivery statuses and the new checkpoint are written in one
+# transaction; a crashed broadcast resumes after the last completed page.
+import argparse
+import asyncio
+import logging
+import os
+
+from sqlalchemy import select, update
+from telegram.error import Forbidden, TelegramError
+
+from config import Session
+from models import Broadcast, BroadcastDelivery, User
+from rate_limiter import BULK
+import repository
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_PAGE_SIZE = int(os.getenv("BROADCAST_PAGE_SIZE", "500"))
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "20"))
+
+
+def create_broadcast(text, preference_code=None, school=None):
+    session = Session()
+    try:
+        broadcast = Broadcast(
+            text=text, preference_code=preference_code, school=school, sent=0, failed=0
+        )
+        session.add(broadcast)
+        session.commit()
+        return broadcast.id
+    finally:
+        Session.remove()
+
+
+def _load_broadcast(broadcast_id):
+    session = Session()
+    try:
+        broadcast = session.get(Broadcast, broadcast_id)
+        if broadcast is not None:
+            session.expunge(broadcast)
+        return broadcast
+    finally:
+        Session.remove()
+
+
+def _next_page(broadcast, after_chat_id, page_size):
+    query = select(User.chat_id).order_by(User.chat_id).limit(page_size)
+    if after_chat_id is not None:
+        query = query.where(User.chat_id > after_chat_id)
+    if broadcast.preference_code is not None:
+        query = query.where(User.preference_code == broadcast.preference_code)
+    if broadcast.school is not None:
+        query = query.where(User.school == broadcast.school)
+    session = Session()
+    try:
+        return session.execute(query).scalars().all()
+    finally:
+        Session.remove()
+
+
+def _record_page(broadcast_id, results, last_chat_id):
+    sent = sum(status == "sent" for _, status, _ in results)
+    session = Session()
+    try:
+        session.execute(
+            repository.insert(
+                BroadcastDelivery.__table__, session.get_bind()
+            ).on_conflict_do_nothing(),
+            [
+                {
+                    "broadcast_id": broadcast_id,
+                    "chat_id": chat_id,
+                    "status": status,
+                    "error": error,
+                }
+                for chat_id, status, error in results
+            ],
+        )
+        session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id)
+            .values(
+                last_chat_id=last_chat_id,
+                sent=Broadcast.sent + sent,
+                failed=Broadcast.failed + len(results) - sent,
+            )
+        )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        Session.remove()
+
+
+def _finish(broadcast_id):
+    session = Session()
+    try:
+        session.execute(
+            update(Broadcast).where(Broadcast.id == broadcast_id).values(status="done")
+        )
+        session.commit()
+        return session.get(Broadcast, broadcast_id)
+    finally:
+        Session.remove()
+
+
+async def _deliver(bot, chat_id, text, semaphore):
+    async with semaphore:
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, rate_limit_args=BULK)
+            return chat_id, "sent", None
+        except Forbidden as e:
+            return chat_id, "blocked", str(e)  # User blocked the bot
+        except TelegramError as e:
+            return chat_id, "failed", str(e)
+
+
+async def run_broadcast(
+    bot, broadcast_id, page_size=BROADCAST_PAGE_SIZE, concurrency=BROADCAST_CONCURRENCY
+):
+    # Sends are throttled by the bot's rate limiter; concurrency only bounds
+    # how many requests are in flight at once.
+    broadcast = await repository.run_in_db(_load_broadcast, broadcast_id)
+    if broadcast is None:
+        raise ValueError(f"Unknown broadcast: {broadcast_id}")
+    semaphore = asyncio.Semaphore(concurrency)
+    after_chat_id = broadcast.last_chat_id
+    while True:
+        chat_ids = await repository.run_in_db(
+            _next_page, broadcast, after_chat_id, page_size
+        )
+        if not chat_ids:
+            break
+        results = await asyncio.gather(
+            *(_deliver(bot, chat_id, broadcast.text, semaphore) for chat_id in chat_ids)
+        )
+        after_chat_id = chat_ids[-1]
+        await repository.run_in_db(_record_page, broadcast_id, results, after_chat_id)
+        logger.info("Broadcast %d reached chat %d", broadcast_id, after_chat_id)
+    finished = await repository.run_in_db(_finish, broadcast_id)
+    return finished.sent, finished.failed
+
+
+async def _main(args):
+    from telegram.ext import ExtBot
+
+    from config import TELEGRAM_BOT_TOKEN, engine
+    from models import initialize_database
+    from rate_limiter import TokenBucketRateLimiter
+
+    initialize_database(engine)
+    if args.resume is not None:
+        broadcast_id = args.resume
+    else:
+        broadcast_id = create_broadcast(args.text, args.preference, args.school)
+    async with ExtBot(TELEGRAM_BOT_TOKEN, rate_limiter=TokenBucketRateLimiter()) as bot:
+        sent, failed = await run_broadcast(bot, broadcast_id)
+    print(f"Broadcast {broadcast_id}: {sent} sent, {failed} failed")
+    repository.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--text")
+    group.add_argument("--resume", type=int, help="Continue an interrupted broadcast")
+    parser.add_argument("--preference", type=int, help="Preference code, 1-4")
+    parser.add_argument("--school")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
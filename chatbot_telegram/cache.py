@@ -0,0 +1,102 @@
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from constants import PREFERENCE_OPTIONS
+
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", "300"))
+
+
+@dataclass(frozen=True, slots=True)
+class UserSnapshot:
+    # Immutable copy of a users row, safe to share between handlers
+    chat_id: int
+    first_name: str
+    last_name: str
+    age: int
+    school: str
+    email: str
+    bio: str
+    preference_code: int
+
+    @property
+    def preferences(self):
+        return PREFERENCE_OPTIONS.get(self.preference_code)
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(
+            chat_id=user.chat_id,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            age=user.age,
+            school=user.school,
+            email=user.email,
+            bio=user.bio,
+            preference_code=user.preference_code,
+        )
+
+
+class ProfileCache:
+    # LRU cache of UserSnapshot keyed by chat_id, with a per-entry TTL
+
+    def __init__(self, max_size=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # Bumped on every invalidation; a load that started before a write
+        # must not store what it read (see put()).
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, chat_id):
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        snapshot, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[chat_id]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(chat_id)
+        self.hits += 1
+        return snapshot
+
+    def generation(self):
+        return self._generation
+
+    def put(self, chat_id, snapshot, generation):
+        if self.max_size <= 0 or generation != self._generation:
+            return
+        self._entries[chat_id] = (snapshot, time.monotonic() + self.ttl)
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, chat_id):
+        self._generation += 1
+        self._entries.pop(chat_id, None)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+profile_cache = ProfileCache()
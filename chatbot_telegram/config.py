@@ -1,12 +1,82 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import scoped_session, sessionmaker
 from dotenv import load_dotenv
 import os
 
 load_dotenv()  # This loads the environment variables from .env
 
-DATABASE_URL = "sqlite:///user_info.db"
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///user_info.db")
+DATABASE_PROFILE = os.getenv("DATABASE_PROFILE", "wal")
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+# Chats allowed to run admin commands such as /broadcast
+ADMIN_CHAT_IDS = {
+    int(chat_id) for chat_id in os.getenv("ADMIN_CHAT_IDS", "").split(",") if chat_id.strip()
+}
 
-engine = create_engine(DATABASE_URL)
+# Named engine profiles. "pragmas" are applied to every new SQLite
+# connection; "pool" is passed to create_engine for server databases.
+ENGINE_PROFILES = {
+    # Driver defaults, kept for comparison
+    "default": {"pragmas": {}, "pool": {}},
+    # WAL lets readers run alongside the single writer; synchronous=NORMAL
+    # only fsyncs at checkpoints, which is still safe in WAL mode
+    "wal": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,
+            "cache_size": -20000,  # Negative means KiB, so ~20MB
+            "mmap_size": 268435456,
+            "temp_store": "MEMORY",
+        },
+        "pool": {},
+    },
+    # WAL without fsync on commit; for benchmarks and throwaway databases
+    "wal-unsafe": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "OFF",
+            "busy_timeout": 5000,
+            "cache_size": -20000,
+            "mmap_size": 268435456,
+            "temp_store": "MEMORY",
+        },
+        "pool": {},
+    },
+    # Postgres/MySQL: bounded pool with liveness checks
+    "server": {
+        "pragmas": {},
+        "pool": {
+            "pool_size": int(os.getenv("DATABASE_POOL_SIZE", "10")),
+            "max_overflow": int(os.getenv("DATABASE_MAX_OVERFLOW", "20")),
+            "pool_timeout": 30,
+            "pool_recycle": 1800,
+            "pool_pre_ping": True,
+        },
+    },
+}
+
+
+def create_db_engine(url=DATABASE_URL, profile=DATABASE_PROFILE):
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown database profile: {profile}")
+    settings = ENGINE_PROFILES[profile]
+    if not url.startswith("sqlite"):
+        return create_engine(url, **settings["pool"])
+
+    db_engine = create_engine(url)
+    pragmas = settings["pragmas"]
+    if pragmas:
+
+        @event.listens_for(db_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    return db_engine
+
+
+engine = create_db_engine()
 Session = scoped_session(sessionmaker(bind=engine))
@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The bot's modules import each other by plain name, as when run from
+# chatbot_telegram/, and config.py must never point at the real database
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'unused.db')}"
+
+collect_ignore = ["benchmarks"]  # load_test.py is a script, not a test module
+
+
+@pytest.fixture
+def database(tmp_path):
+    # A migrated SQLite database of its own for each test, and an empty
+    # profile cache
+    from cache import profile_cache
+    from config import Session, create_db_engine, engine
+    from models import initialize_database
+
+    test_engine = create_db_engine(f"sqlite:///{tmp_path / 'users.db'}")
+    initialize_database(test_engine)
+    Session.configure(bind=test_engine)
+    profile_cache.clear()
+    yield test_engine
+    Session.remove()
+    Session.configure(bind=engine)
+    profile_cache.clear()
+    test_engine.dispose()
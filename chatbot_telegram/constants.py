@@ -16,3 +16,40 @@
     UPDATE_SCHOOL,
     UPDATE_PREFERENCES,
 ) = range(15)
+
+# Lower-case state names, for metrics labels
+STATE_NAMES = {
+    state: name.lower()
+    for name, state in list(globals().items())
+    if name.isupper() and isinstance(state, int)
+}
+
+# Fields offered by /update and the state that collects each one
+UPDATE_CHOICES = {
+    "first name": UPDATE_FIRST_NAME,
+    "last name": UPDATE_LAST_NAME,
+    "email": UPDATE_EMAIL,
+    "bio": UPDATE_BIO,
+    "age": UPDATE_AGE,
+    "school": UPDATE_SCHOOL,
+    "preferences": UPDATE_PREFERENCES,
+}
+
+# Stored as users.preference_code; the numbers are what users type
+PREFERENCE_OPTIONS = {
+    1: "Use AI to strategize where to apply",
+    2: "Help with SAT / ACT preparation",
+    3: "Assistance with writing essays",
+    4: "Affordable mentorship",
+}
+
+# Age buckets for registration statistics: (oldest age in the bucket, label).
+# Older ages fall in AGE_BUCKET_OLDEST.
+AGE_BUCKETS = [
+    (13, "13 and under"),
+    (15, "14-15"),
+    (17, "16-17"),
+    (19, "18-19"),
+    (24, "20-24"),
+]
+AGE_BUCKET_OLDEST = "25+"
@@ -1,9 +1,20 @@
-from telegram.ext import ConversationHandler, CommandHandler, MessageHandler, filters
+import warnings
+from telegram.ext import CallbackQueryHandler, CommandHandler, MessageHandler, filters
 from constants import *
+from metrics import time_handler
+from state_store import BoundedConversationHandler
+from telegram.warnings import PTBUserWarning
 from handlers import start, update, cancel, first_name, last_name, email, age, school, preferences, bio, update_choice, update_first_name, update_last_name, update_email, update_age, update_school, update_preferences, update_bio
 
+# Button presses are tracked per chat like messages (per_message=False) on
+# purpose, since every keyboard belongs to the single open conversation.
+warnings.filterwarnings(
+    "ignore", message="If 'per_message=False'", category=PTBUserWarning
+)
+
+
 def get_conversation_handler():
-    return ConversationHandler(
+    conversation = BoundedConversationHandler(
         entry_points=[CommandHandler("start", start), CommandHandler("update", update)],
         states={
             FIRST_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, first_name)],
@@ -11,10 +22,17 @@ def get_conversation_handler():
             EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, email)],
             BIO: [MessageHandler(filters.TEXT & ~filters.COMMAND, bio)],
             AGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, age)],
-            SCHOOL: [MessageHandler(filters.TEXT & ~filters.COMMAND, school)],
-            PREFERENCES: [MessageHandler(filters.TEXT & ~filters.COMMAND, preferences)],
+            SCHOOL: [
+                CallbackQueryHandler(school, pattern="^school:"),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, school),
+            ],
+            PREFERENCES: [
+                CallbackQueryHandler(preferences, pattern="^pref:"),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, preferences),
+            ],
             UPDATE_CHOICE: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, update_choice)
+                CallbackQueryHandler(update_choice, pattern="^update:"),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, update_choice),
             ],
             UPDATE_FIRST_NAME: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, update_first_name)
@@ -28,11 +46,24 @@ def get_conversation_handler():
             UPDATE_BIO: [MessageHandler(filters.TEXT & ~filters.COMMAND, update_bio)],
             UPDATE_AGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, update_age)],
             UPDATE_SCHOOL: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, update_school)
+                CallbackQueryHandler(update_school, pattern="^school:"),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, update_school),
             ],
             UPDATE_PREFERENCES: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, update_preferences)
+                CallbackQueryHandler(update_preferences, pattern="^pref:"),
+                MessageHandler(filters.TEXT & ~filters.COMMAND, update_preferences),
             ],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
-    )
\ No newline at end of file
+        name="registration",
+        persistent=True,  # Stored by persistence.SQLitePersistence
+    )
+    # Time every callback, labelled with the state it runs in
+    for handler in conversation.entry_points:
+        handler.callback = time_handler(handler.callback, "entry")
+    for state, handlers in conversation.states.items():
+        for handler in handlers:
+            handler.callback = time_handler(handler.callback, STATE_NAMES[state])
+    for handler in conversation.fallbacks:
+        handler.callback = time_handler(handler.callback, "fallback")
+    return conversation
\ No newline at end of file
@@ -0,0 +1,157 @@
+# Streams user profiles to CSV, JSONL or Parquet with constant memory.
+#
+#   python export.py --format csv --output users.csv [--preference 2]
+#       [--school "Minerva University"] [--min-age 16] [--max-age 18]
+#
+# Rows are fetched with yield_per and written chunk by chunk, so the table is
+# never loaded as a whole. Parquet needs pyarrow, which is not a bot
+# dependency: pip install pyarrow
+import argparse
+import csv
+import json
+import sys
+import time
+
+from sqlalchemy import select
+
+from config import Session
+from constants import PREFERENCE_OPTIONS
+from models import User
+
+EXPORT_CHUNK_SIZE = 10000
+
+COLUMNS = [
+    "chat_id",
+    "first_name",
+    "last_name",
+    "age",
+    "school",
+    "email",
+    "bio",
+    "preferences",
+]
+
+
+def build_query(preference=None, school=None, min_age=None, max_age=None):
+    query = select(
+        User.chat_id,
+        User.first_name,
+        User.last_name,
+        User.age,
+        User.school,
+        User.email,
+        User.bio,
+        User.preference_code,
+    ).order_by(User.chat_id)
+    if preference is not None:
+        query = query.where(User.preference_code == preference)
+    if school is not None:
+        query = query.where(User.school == school)
+    if min_age is not None:
+        query = query.where(User.age >= min_age)
+    if max_age is not None:
+        query = query.where(User.age <= max_age)
+    return query
+
+
+def iter_chunks(query, chunk_size=EXPORT_CHUNK_SIZE):
+    # Yields lists of row tuples with the preference code resolved to text
+    session = Session()
+    try:
+        result = session.execute(query.execution_options(yield_per=chunk_size))
+        for partition in result.partitions():
+            yield [
+                (*row[:-1], PREFERENCE_OPTIONS.get(row[-1])) for row in partition
+            ]
+    finally:
+        Session.remove()
+
+
+def write_csv(chunks, output):
+    writer = csv.writer(output)
+    writer.writerow(COLUMNS)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield len(chunk)
+
+
+def write_jsonl(chunks, output):
+    for chunk in chunks:
+        output.write(
+            "".join(
+                json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n"
+                for row in chunk
+            )
+        )
+        yield len(chunk)
+
+
+def write_parquet(chunks, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        sys.exit("Parquet export needs pyarrow: pip install pyarrow")
+
+    schema = pa.schema(
+        [
+            ("chat_id", pa.int64()),
+            ("first_name", pa.string()),
+            ("last_name", pa.string()),
+            ("age", pa.int32()),
+            ("school", pa.string()),
+            ("email", pa.string()),
+            ("bio", pa.string()),
+            ("preferences", pa.string()),
+        ]
+    )
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            yield len(chunk)
+
+
+def export(fmt, output_path, **filters):
+    chunks = iter_chunks(build_query(**filters))
+    started = time.perf_counter()
+    rows = 0
+    if fmt == "parquet":
+        progress = write_parquet(chunks, output_path)
+        for count in progress:
+            rows += count
+    else:
+        writer = write_csv if fmt == "csv" else write_jsonl
+        newline = "" if fmt == "csv" else None
+        with open(output_path, "w", encoding="utf-8", newline=newline) as output:
+            for count in writer(chunks, output):
+                rows += count
+    return rows, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--format", choices=["csv", "jsonl", "parquet"], default="csv")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--preference", type=int, help="Preference code, 1-4")
+    parser.add_argument("--school")
+    parser.add_argument("--min-age", type=int)
+    parser.add_argument("--max-age", type=int)
+    args = parser.parse_args()
+
+    rows, elapsed = export(
+        args.format,
+        args.output,
+        preference=args.preference,
+        school=args.school,
+        min_age=args.min_age,
+        max_age=args.max_age,
+    )
+    print(
+        f"Exported {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
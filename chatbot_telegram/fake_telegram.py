@@ -0,0 +1,195 @@
+# Offline stand-ins for the Telegram side of the bot:
+#
+# * FakeBotRequest answers Bot API calls locally, so an Application can run
+#   with no network and every outgoing call is recorded.
+# * make_message_update() builds the JSON Telegram would send for a message.
+# * Run as a script, it plays Telegram against a webhook-mode bot:
+#
+#   WEBHOOK_SECRET=test python bot.py --mode webhook --fake-api
+#   WEBHOOK_SECRET=test python fake_telegram.py --url http://127.0.0.1:8443/telegram --chats 500
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import time
+
+from telegram.request import BaseRequest
+
+# Simulated Bot API round trip for the fake bot built by bot.py --fake-api
+FAKE_API_LATENCY = float(os.getenv("FAKE_API_LATENCY_MS", "0")) / 1000
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "GetIn Bot", "username": "getin_bot"}
+
+
+class FakeBotRequest(BaseRequest):
+    def __init__(self, latency=FAKE_API_LATENCY):
+        self.latency = latency  # Simulated Bot API round trip in seconds
+        self.calls = []  # (method, parameters, monotonic time)
+        self.last_messages = {}  # chat_id -> (message dict, reply_markup)
+        self._message_ids = itertools.count(1)
+        self._waiters = {}
+
+    def wait_for_reply(self, chat_id):
+        # Future resolved with the next message sent or edited in the chat
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(chat_id, []).append(future)
+        return future
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @property
+    def read_timeout(self):
+        return None
+
+    def _message(self, parameters):
+        return {
+            "message_id": parameters.get("message_id") or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": parameters.get("chat_id"), "type": "private"},
+            "from": BOT_USER,
+            "text": parameters.get("text", ""),
+        }
+
+    async def do_request(
+        self,
+        url,
+        method,
+        request_data=None,
+        read_timeout=None,
+        write_timeout=None,
+        connect_timeout=None,
+        pool_timeout=None,
+    ):
+        api_method = url.rsplit("/", 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        self.calls.append((api_method, parameters, time.monotonic()))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if api_method == "getMe":
+            result = BOT_USER
+        elif api_method in ("sendMessage", "editMessageText"):
+            result = self._message(parameters)
+            chat_id = parameters.get("chat_id")
+            self.last_messages[chat_id] = (result, parameters.get("reply_markup"))
+            for waiter in self._waiters.pop(chat_id, []):
+                if not waiter.done():
+                    waiter.set_result(result)
+        elif api_method == "getUpdates":
+            await asyncio.sleep(1)  # Nothing to deliver in offline mode
+            result = []
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+_update_ids = itertools.count(1)
+
+
+def make_message_update(chat_id, text, update_id=None):
+    entities = []
+    if text.startswith("/"):
+        entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {
+        "update_id": next(_update_ids) if update_id is None else update_id,
+        "message": {
+            "message_id": next(_update_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "Student"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Student"},
+            "text": text,
+            "entities": entities,
+        },
+    }
+
+
+def make_callback_update(chat_id, message, data, update_id=None):
+    # A button press on one of the bot's messages
+    update_id = next(_update_ids) if update_id is None else update_id
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": str(chat_id),
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Student"},
+            "message": message,
+            "data": data,
+        },
+    }
+
+
+def find_button(reply_markup, choice):
+    # Callback data of the button whose label or value matches choice
+    for row in (reply_markup or {}).get("inline_keyboard", []):
+        for button in row:
+            data = button.get("callback_data", "")
+            if button["text"].lower() == choice.lower() or data.rsplit(":", 1)[-1] == choice:
+                return data
+    return None
+
+
+REGISTRATION = [
+    "/start",
+    "ada",
+    "lovelace",
+    "ada@example.com",
+    "17",
+    "Minerva University",
+    "2",
+    "I like maths.",
+]
+
+
+async def _send_chat(client, url, headers, chat_id, latencies, statuses):
+    for text in REGISTRATION:
+        started = time.perf_counter()
+        response = await client.post(
+            url, json=make_message_update(chat_id, text), headers=headers
+        )
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+
+async def _load(url, secret, chats, first_chat_id, connections):
+    import httpx
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    latencies, statuses = [], {}
+    limits = httpx.Limits(max_connections=connections)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await asyncio.gather(
+            *(
+                _send_chat(client, url, headers, first_chat_id + i, latencies, statuses)
+                for i in range(chats)
+            )
+        )
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    print(
+        f"{len(latencies)} updates in {elapsed:.2f}s ({len(latencies) / elapsed:.0f}/s), "
+        f"ack p50={latencies[len(latencies) // 2] * 1000:.1f}ms "
+        f"p99={latencies[int(len(latencies) * 0.99)] * 1000:.1f}ms, statuses={statuses}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8443/telegram")
+    parser.add_argument("--secret", default=os.getenv("WEBHOOK_SECRET", ""))
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--first-chat-id", type=int, default=10**9)
+    # Telegram opens at most 40 webhook connections by default
+    parser.add_argument("--connections", type=int, default=40)
+    args = parser.parse_args()
+    asyncio.run(
+        _load(args.url, args.secret, args.chats, args.first_chat_id, args.connections)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+import time
+import zlib
+from collections import OrderedDict
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ApplicationHandlerStop, CallbackContext
+
+from config import ADMIN_CHAT_IDS
+from metrics import flood_dropped
+from rate_limiter import TokenBucket
+
+# Per chat: sustained updates per second and burst size
+FLOOD_CHAT_RATE = float(os.getenv("FLOOD_CHAT_RATE", "1"))
+FLOOD_CHAT_BURST = float(os.getenv("FLOOD_CHAT_BURST", "5"))
+# The same text or button twice in a chat within this many seconds is dropped
+FLOOD_DUPLICATE_WINDOW = float(os.getenv("FLOOD_DUPLICATE_WINDOW", "2"))
+# Longest text accepted; the longest answer we ask for is the bio. Admin
+# chats may send up to Telegram's own limit, for long /broadcast messages
+FLOOD_MAX_TEXT = int(os.getenv("FLOOD_MAX_TEXT", "1000"))
+MAX_TRACKED_CHATS = 10000
+
+
+class FloodGuard:
+    # Runs in a handler group before the conversation handler and stops
+    # unwanted updates with ApplicationHandlerStop, so they never reach a
+    # handler or the database. Each chat gets a token bucket; exact repeats
+    # within FLOOD_DUPLICATE_WINDOW are dropped; oversized texts are
+    # rejected with a short reply, unless they come from an admin chat.
+    # Dropped button presses are answered, at most once per token refill,
+    # so the client stops its spinner. Dropped updates are counted by reason.
+
+    def __init__(
+        self,
+        rate=FLOOD_CHAT_RATE,
+        burst=FLOOD_CHAT_BURST,
+        duplicate_window=FLOOD_DUPLICATE_WINDOW,
+        max_text=FLOOD_MAX_TEXT,
+        admin_chat_ids=ADMIN_CHAT_IDS,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.duplicate_window = duplicate_window
+        self.max_text = max_text
+        self.admin_chat_ids = admin_chat_ids
+        # chat id -> [bucket, last payload crc, its time, last dropped query answered]
+        self._chats = OrderedDict()
+
+    def _chat(self, chat_id):
+        entry = self._chats.get(chat_id)
+        if entry is None:
+            entry = self._chats[chat_id] = [TokenBucket(self.rate, self.burst), None, 0.0, float("-inf")]
+            if len(self._chats) > MAX_TRACKED_CHATS:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return entry
+
+    async def check(self, update: Update, context: CallbackContext):
+        if update.effective_chat is None:
+            return
+        if update.callback_query is not None:
+            payload = update.callback_query.data or ""
+        elif update.message is not None and update.message.text is not None:
+            payload = update.message.text
+            if (
+                len(payload) > self.max_text
+                and update.effective_chat.id not in self.admin_chat_ids
+            ):
+                flood_dropped.inc("oversize")
+                await update.message.reply_text(
+                    f"That message is too long. Please keep it under {self.max_text} characters."
+                )
+                raise ApplicationHandlerStop
+        else:
+            return
+
+        entry = self._chat(update.effective_chat.id)
+        now = time.monotonic()
+        checksum = zlib.crc32(payload.encode())
+        if checksum == entry[1] and now - entry[2] < self.duplicate_window:
+            await self._drop(update, entry, now, "duplicate")
+        entry[1], entry[2] = checksum, now
+        if entry[0].try_acquire():
+            await self._drop(update, entry, now, "rate")
+
+    async def _drop(self, update, entry, now, reason):
+        flood_dropped.inc(reason)
+        if update.callback_query is not None and now - entry[3] >= 1 / self.rate:
+            entry[3] = now
+            try:
+                await update.callback_query.answer()
+            except TelegramError:
+                pass  # Too old to answer; the client has given up on it
+        raise ApplicationHandlerStop
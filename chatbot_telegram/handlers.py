@@ -1,401 +1,475 @@
-from telegram import Update
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import CallbackContext
 from telegram.ext import ConversationHandler
 import re
 from sqlalchemy.exc import SQLAlchemyError
-from models import User
-from config import Session
+import repository
+import schools
+from metrics import registrations
 from email_utils import is_valid_email
+from validators import parse_age, parse_preference
+from replies import coalesce_replies, reply, respond
 from constants import *
 
+# Inline keyboards; callback data is "<prefix>:<value>", see user_input()
+PREFERENCE_KEYBOARD = InlineKeyboardMarkup(
+    [
+        [InlineKeyboardButton(text, callback_data=f"pref:{code}")]
+        for code, text in PREFERENCE_OPTIONS.items()
+    ]
+)
+UPDATE_KEYBOARD = InlineKeyboardMarkup(
+    [
+        [
+            InlineKeyboardButton("First Name", callback_data="update:first name"),
+            InlineKeyboardButton("Last Name", callback_data="update:last name"),
+        ],
+        [
+            InlineKeyboardButton("Age", callback_data="update:age"),
+            InlineKeyboardButton("School", callback_data="update:school"),
+        ],
+        [
+            InlineKeyboardButton("Email", callback_data="update:email"),
+            InlineKeyboardButton("Bio", callback_data="update:bio"),
+        ],
+        [InlineKeyboardButton("Preferences", callback_data="update:preferences")],
+        [InlineKeyboardButton("Done", callback_data="update:done")],
+    ]
+)
+
+
+def school_keyboard(candidates, typed):
+    # Catalog suggestions for a typed school name, plus keeping it as typed
+    return InlineKeyboardMarkup(
+        [
+            [InlineKeyboardButton(school.name, callback_data=f"school:{school.id}")]
+            for school, _ in candidates
+        ]
+        + [[InlineKeyboardButton(f"Keep \"{typed[:40]}\"", callback_data="school:keep")]]
+    )
+
+
+def user_input(update: Update) -> str:
+    # Button presses carry their value in the callback data; typed
+    # messages are used as they are
+    if update.callback_query is not None:
+        return update.callback_query.data.split(":", 1)[1]
+    return update.message.text
+
 # Function to display available commands
 async def show_commands(update: Update):
     commands = "/start - Register or view your information\n/update - Update your existing information\n/cancel - Cancel the current operation"
-    await update.message.reply_text(f"Here are the functions you can use:\n{commands}")
+    await reply(update, f"Here are the functions you can use:\n{commands}")
 
 
 # Define conversation handler functions
+@coalesce_replies
 async def start(update: Update, context: CallbackContext) -> int:
-    session = Session()
-    user = (
-        session.query(User)
-        .filter(User.chat_id == str(update.effective_chat.id))
-        .first()
-    )
+    user = await repository.get_user(update.effective_chat.id)
     if user:
-        await update.message.reply_text(
-            f"Welcome back! Here is your info:\nFirst name: {user.first_name}\nLast name: {user.last_name}\nAge: {user.age}\nSchool: {user.school}\nEmail: {user.email}\nPreferences: {user.preferences}\nBio: {user.bio}\nYou can update your information by sending /update"
+        await reply(
+            update,
+            f"Welcome back! Here is your info:\nFirst name: {user.first_name}\nLast name: {user.last_name}\nAge: {user.age}\nSchool: {user.school}\nEmail: {user.email}\nPreferences: {user.preferences}\nBio: {user.bio}\nYou can update your information by sending /update",
         )
-        Session.remove()
         return ConversationHandler.END
     else:
+        # Marks the draft so bio() or cancel() can tell how it ended
+        context.user_data.registering = True
+        registrations.inc("started")
         await show_commands(update)  # Show available commands at the beginning
-        await update.message.reply_text(
-            "Hi! My name is GetIn Bot. I am here to collect some of your information in relation to our newly developed educational platform GetIn that will simplify college application experience for everyone!. First of all, what is your first name?"
+        await reply(
+            update,
+            "Hi! My name is GetIn Bot. I am here to collect some of your information in relation to our newly developed educational platform GetIn that will simplify college application experience for everyone!. First of all, what is your first name?",
         )
         return FIRST_NAME
 
 
+@coalesce_replies
 async def first_name(update: Update, context: CallbackContext) -> int:
-    context.user_data["first_name"] = (
+    context.user_data.first_name = (
         update.message.text.title()
     )  # Store first name with capitalization
-    await update.message.reply_text("Great! Now, what is your last name?")
+    await reply(update, "Great! Now, what is your last name?")
     return LAST_NAME
 
 
+@coalesce_replies
 async def last_name(update: Update, context: CallbackContext) -> int:
-    context.user_data["last_name"] = (
+    context.user_data.last_name = (
         update.message.text.title()
     )  # Store last name with capitalization
-    await update.message.reply_text(
-        "Nice to meet you! Can you give me your email address?"
+    await reply(
+        update,
+        "Nice to meet you! Can you give me your email address?",
     )
     return EMAIL
 
 
+@coalesce_replies
 async def email(update: Update, context: CallbackContext) -> int:
     user_email = update.message.text
     if is_valid_email(user_email):
-        context.user_data["email"] = user_email
-        await update.message.reply_text(
-            "Thank you! Now, can you tell me how old you are?"
+        context.user_data.email = user_email
+        await reply(
+            update,
+            "Thank you! Now, can you tell me how old you are?",
         )
         return AGE
     else:
-        await update.message.reply_text(
-            "It seems like you entered an invalid email address. Please enter a valid email address."
+        await reply(
+            update,
+            "It seems like you entered an invalid email address. Please enter a valid email address.",
         )
         return EMAIL
 
 
+@coalesce_replies
 async def age(update: Update, context: CallbackContext) -> int:
-    age = update.message.text
-    if age.isdigit():
-        context.user_data["age"] = int(age)
-        await update.message.reply_text("Amazing! What school do you attend?")
+    age = parse_age(update.message.text)
+    if age is not None:
+        context.user_data.age = age
+        await reply(update, "Amazing! What school do you attend?")
         return SCHOOL
     else:
-        await update.message.reply_text("Please enter a valid age.")
+        await reply(update, "Please enter a valid age.")
         return AGE
 
 
+async def choose_school(update: Update, context: CallbackContext):
+    # Returns (school name, catalog id or None) once the school is settled.
+    # A typed name the catalog matches unambiguously is taken as is; a
+    # close one gets suggestion buttons and None is returned until the
+    # user picks one. The typed name waits in the draft meanwhile.
+    catalog = schools.catalog()
+    if update.callback_query is not None:
+        choice = user_input(update)
+        school = catalog.get(int(choice)) if choice.isdecimal() else None
+        if school is not None:
+            return school.name, school.id
+        if context.user_data.school is None:
+            await respond(update, "Please type the name of your school.")
+            return None
+        return context.user_data.school, None
+    typed = update.message.text.strip()
+    if len(catalog) > schools.SCHOOL_INLINE_MAX:
+        school, candidates = await schools.run_in_matcher(catalog.match, typed)
+    else:
+        school, candidates = catalog.match(typed)
+    if school is not None:
+        return school.name, school.id
+    if not candidates:
+        return typed, None
+    context.user_data.school, context.user_data.school_id = typed, None
+    await reply(
+        update,
+        "Did you mean one of these? Choose your school, or keep it as you typed it.",
+        reply_markup=school_keyboard(candidates, typed),
+    )
+    return None
+
+
+@coalesce_replies
 async def school(update: Update, context: CallbackContext) -> int:
-    context.user_data["school"] = update.message.text
-    await update.message.reply_text(
-        "What are you looking for the most in GetIn?\n"
-        "1. Use AI to strategize where to apply\n"
-        "2. Help with SAT / ACT preparation\n"
-        "3. Assistance with writing essays\n"
-        "4. Affordable mentorship\n"
-        "Please type the number of your choice."
+    choice = await choose_school(update, context)
+    if choice is None:
+        return SCHOOL
+    context.user_data.school, context.user_data.school_id = choice
+    await respond(
+        update,
+        "What are you looking for the most in GetIn? Please choose one of the options below.",
+        reply_markup=PREFERENCE_KEYBOARD,
     )
     return PREFERENCES
 
 
+@coalesce_replies
 async def preferences(update: Update, context: CallbackContext) -> int:
-    preference_options = {
-        "1": "Use AI to strategize where to apply",
-        "2": "Help with SAT / ACT preparation",
-        "3": "Assistance with writing essays",
-        "4": "Affordable mentorship"
-    }
-    
-    preference_number = update.message.text
-    preference_text = preference_options.get(preference_number, None)
-    
+    preference_code = parse_preference(user_input(update))
+    preference_text = PREFERENCE_OPTIONS.get(preference_code)
+
     if preference_text:
-        context.user_data["preferences"] = preference_text
-        await update.message.reply_text(
-            f"Thank you! We'll tailor our services based on your preference for: {preference_text}. Lastly, can you tell me a little about yourself?"
+        context.user_data.preference_code = preference_code
+        await respond(
+            update,
+            f"Thank you! We'll tailor our services based on your preference for: {preference_text}. Lastly, can you tell me a little about yourself?",
         )
         return BIO
     else:
-        await update.message.reply_text(
-            "It seems like you entered an invalid option. Please select from the following options:\n"
-            "1. Use AI to strategize where to apply\n"
-            "2. Help with SAT / ACT preparation\n"
-            "3. Assistance with writing essays\n"
-            "4. Affordable mentorship\n"
-            "Please type the number of your choice."
+        await respond(
+            update,
+            "It seems like you entered an invalid option. Please choose one of the options below.",
+            reply_markup=PREFERENCE_KEYBOARD,
         )
         return PREFERENCES
 
 
+@coalesce_replies
 async def bio(update: Update, context: CallbackContext) -> int:
-    session = Session()
     try:
-        new_user = User(
-            chat_id=str(update.effective_chat.id),
-            first_name=context.user_data["first_name"],
-            last_name=context.user_data["last_name"],
-            age=context.user_data["age"],
-            school=context.user_data["school"],
-            email=context.user_data["email"],
-            preferences=context.user_data["preferences"],
+        await repository.upsert_user(
+            update.effective_chat.id,
+            first_name=context.user_data.first_name,
+            last_name=context.user_data.last_name,
+            age=context.user_data.age,
+            school=context.user_data.school,
+            school_id=context.user_data.school_id,
+            email=context.user_data.email,
+            preference_code=context.user_data.preference_code,
             bio=update.message.text,
         )
-        session.add(new_user)
-        session.commit()
-        await update.message.reply_text(
-            "Thank you for sharing about yourself, that would be all! Have a great day!"
+        if context.user_data.registering:
+            registrations.inc("completed")
+        await reply(
+            update,
+            "Thank you for sharing about yourself, that would be all! Have a great day!",
         )
     except SQLAlchemyError as e:
-        await update.message.reply_text(
-            "Sorry, there was a problem saving your information. Please try again later."
+        await reply(
+            update,
+            "Sorry, there was a problem saving your information. Please try again later.",
         )
-    finally:
-        Session.remove()
     return ConversationHandler.END
 
 
+@coalesce_replies
 async def update(update: Update, context: CallbackContext) -> int:
-    await update.message.reply_text(
-        "What information would you like to update?\n1. First Name\n2. Last Name\n3. Age Name\n4. School\n5. Email\n6. Preferences\n7. Bio\nPlease choose: First Name, Last Name, Age, School, Email, Preferences, or Bio, or type /cancel to stop."
+    await reply(
+        update,
+        "What information would you like to update? Choose below, or type /cancel to stop.",
+        reply_markup=UPDATE_KEYBOARD,
     )
     await show_commands(update)  # Show commands when update is initiated
     return UPDATE_CHOICE
 
 
+@coalesce_replies
 async def update_choice(update: Update, context: CallbackContext) -> int:
-    choice = update.message.text.lower()
-    if choice in [
-        "first name",
-        "last name",
-        "email",
-        "bio",
-        "age",
-        "school",
-        "preferences",
-    ]:
+    choice = user_input(update).lower()
+    if choice in UPDATE_CHOICES:
         if choice == "preferences":
-            await update.message.reply_text(
-                "Please enter your new preferences from this list:\n"
-                "What are you looking for the most in GetIn?\n"
-                "1. Use AI to strategize where to apply\n"
-                "2. Help with SAT / ACT preparation\n"
-                "3. Assistance with writing essays\n"
-                "4. Affordable mentorship\n"
-                "Please type the number of your choice."
+            await respond(
+                update,
+                "Please choose your new preferences:",
+                reply_markup=PREFERENCE_KEYBOARD,
             )
-        await update.message.reply_text(f"Please enter your new {choice}:")
-        return {
-            "first name": UPDATE_FIRST_NAME,
-            "last name": UPDATE_LAST_NAME,
-            "email": UPDATE_EMAIL,
-            "bio": UPDATE_BIO,
-            "age": UPDATE_AGE,
-            "school": UPDATE_SCHOOL,
-            "preferences": UPDATE_PREFERENCES,
-        }[choice]
+        else:
+            await respond(update, f"Please enter your new {choice}:")
+        return UPDATE_CHOICES[choice]
     elif choice == "done":
-        await update.message.reply_text("Thank you for using our service. Goodbye!")
+        await respond(update, "Thank you for using our service. Goodbye!")
         return ConversationHandler.END
     else:
-        await update.message.reply_text(
-            "Please choose a valid option: First name, Last name, Email, Age, School, Bio, Preferences, or type Done to finish."
+        await respond(
+            update,
+            "Please choose a valid option: First name, Last name, Email, Age, School, Bio, Preferences, or type Done to finish.",
+            reply_markup=UPDATE_KEYBOARD,
         )
         return UPDATE_CHOICE
 
 
+@coalesce_replies
 async def update_first_name(update: Update, context: CallbackContext) -> int:
     new_first_name = update.message.text.title()  # Capitalize the first letter
-    session = Session()
     try:
-        user = (
-            session.query(User)
-            .filter(User.chat_id == str(update.effective_chat.id))
-            .first()
-        )
-        if user:
-            user.first_name = new_first_name
-            session.commit()
-            await update.message.reply_text(
-                "Your first name has been updated. Would you like to update anything else? Type /update to continue or /cancel to finish."
+        if await repository.update_field(
+            update.effective_chat.id, "first_name", new_first_name
+        ):
+            await reply(
+                update,
+                "Your first name has been updated. Would you like to update anything else? Type /update to continue or /cancel to finish.",
+                reply_markup=UPDATE_KEYBOARD,
             )
         else:
-            await update.message.reply_text(
-                "No user found. Please start the registration process with /start."
+            await reply(
+                update,
+                "No user found. Please start the registration process with /start.",
             )
     except SQLAlchemyError as e:
-        await update.message.reply_text(
-            "Sorry, there was an error updating your first name. Please try again."
+        await reply(
+            update,
+            "Sorry, there was an error updating your first name. Please try again.",
         )
-    finally:
-        Session.remove()
     return UPDATE_CHOICE
 
 
+@coalesce_replies
 async def update_last_name(update: Update, context: CallbackContext) -> int:
     new_last_name = update.message.text.title()  # Capitalize the first letter
-    session = Session()
     try:
-        user = (
-            session.query(User)
-            .filter(User.chat_id == str(update.effective_chat.id))
-            .first()
-        )
-        if user:
-            user.last_name = new_last_name
-            session.commit()
-            await update.message.reply_text(
-                "Your last name has been updated. Would you like to update anything else? Type /update to continue or /cancel to finish."
+        if await repository.update_field(
+            update.effective_chat.id, "last_name", new_last_name
+        ):
+            await reply(
+                update,
+                "Your last name has been updated. Would you like to update anything else? Type /update to continue or /cancel to finish.",
+                reply_markup=UPDATE_KEYBOARD,
             )
         else:
-            await update.message.reply_text(
-                "No user found. Please start the registration process with /start."
+            await reply(
+                update,
+                "No user found. Please start the registration process with /start.",
             )
     except SQLAlchemyError as e:
-        await update.message.reply_text(
-            "Sorry, there was an error updating your last name. Please try again."
+        await reply(
+            update,
+            "Sorry, there was an error updating your last name. Please try again.",
         )
-    finally:
-        Session.remove()
     return UPDATE_CHOICE
 
 
+@coalesce_replies
 async def update_email(update: Update, context: CallbackContext) -> int:
     new_email = update.message.text
     if is_valid_email(new_email):
-        session = Session()
         try:
-            user = (
-                session.query(User)
-                .filter(User.chat_id == str(update.effective_chat.id))
-                .first()
-            )
-            user.email = new_email
-            session.commit()
-            await update.message.reply_text(
-                "Your email has been updated. Would you like to update anything else? If not, type Done."
-            )
+            if await repository.update_field(
+                update.effective_chat.id, "email", new_email
+            ):
+                await reply(
+                    update,
+                    "Your email has been updated. Would you like to update anything else? If not, type Done.",
+                    reply_markup=UPDATE_KEYBOARD,
+                )
+            else:
+                await reply(
+                    update,
+                    "No user found. Please start the registration process with /start.",
+                )
         except SQLAlchemyError as e:
-            await update.message.reply_text(
-                "Sorry, there was an error updating your email."
+            await reply(
+                update,
+                "Sorry, there was an error updating your email.",
             )
-        finally:
-            Session.remove()
     else:
-        await update.message.reply_text(
-            "You have entered an invalid email. Please enter a valid email address."
+        await reply(
+            update,
+            "You have entered an invalid email. Please enter a valid email address.",
         )
         return UPDATE_EMAIL
     return UPDATE_CHOICE
 
 
+@coalesce_replies
 async def update_age(update: Update, context: CallbackContext) -> int:
-    new_age = update.message.text
-    if new_age.isdigit():
-        session = Session()
+    new_age = parse_age(update.message.text)
+    if new_age is not None:
         try:
-            user = (
-                session.query(User)
-                .filter(User.chat_id == str(update.effective_chat.id))
-                .first()
-            )
-            user.age = int(new_age)
-            session.commit()
-            await update.message.reply_text(
-                "Your age has been updated. Would you like to update anything else?"
-            )
+            if await repository.update_field(
+                update.effective_chat.id, "age", new_age
+            ):
+                await reply(
+                    update,
+                    "Your age has been updated. Would you like to update anything else?",
+                    reply_markup=UPDATE_KEYBOARD,
+                )
+            else:
+                await reply(
+                    update,
+                    "No user found. Please start the registration process with /start.",
+                )
         except SQLAlchemyError as e:
-            await update.message.reply_text(
-                "Sorry, there was an error updating your age. Please try again."
+            await reply(
+                update,
+                "Sorry, there was an error updating your age. Please try again.",
             )
-        finally:
-            Session.remove()
     else:
-        await update.message.reply_text("Please enter a valid age.")
+        await reply(update, "Please enter a valid age.")
         return UPDATE_AGE
     return UPDATE_CHOICE
 
 
+@coalesce_replies
 async def update_school(update: Update, context: CallbackContext) -> int:
-    new_school = update.message.text
-    session = Session()
+    choice = await choose_school(update, context)
+    if choice is None:
+        return UPDATE_SCHOOL
+    new_school, school_id = choice
     try:
-        user = (
-            session.query(User)
-            .filter(User.chat_id == str(update.effective_chat.id))
-            .first()
-        )
-        user.school = new_school
-        session.commit()
-        await update.message.reply_text(
-            "Your school has been updated. Would you like to update anything else?"
-        )
+        if await repository.update_fields(
+            update.effective_chat.id, school=new_school, school_id=school_id
+        ):
+            await respond(
+                update,
+                "Your school has been updated. Would you like to update anything else?",
+                reply_markup=UPDATE_KEYBOARD,
+            )
+        else:
+            await respond(
+                update,
+                "No user found. Please start the registration process with /start.",
+            )
     except SQLAlchemyError as e:
-        await update.message.reply_text(
-            "Sorry, there was an error updating your school. Please try again."
+        await respond(
+            update,
+            "Sorry, there was an error updating your school. Please try again.",
         )
-    finally:
-        Session.remove()
     return UPDATE_CHOICE
 
 
+@coalesce_replies
 async def update_preferences(update: Update, context: CallbackContext) -> int:
-    preference_options = {
-        "1": "Use AI to strategize where to apply",
-        "2": "Help with SAT / ACT preparation",
-        "3": "Assistance with writing essays",
-        "4": "Affordable mentorship"
-    }
-
-    preference_number = update.message.text
-    new_preference_text = preference_options.get(preference_number, None)
+    preference_code = parse_preference(user_input(update))
+    new_preference_text = PREFERENCE_OPTIONS.get(preference_code)
 
     if new_preference_text:
-        session = Session()
         try:
-            user = session.query(User).filter(User.chat_id == str(update.effective_chat.id)).first()
-            user.preferences = new_preference_text
-            session.commit()
-            await update.message.reply_text(
-                f"Your preferences have been updated to: {new_preference_text}. Would you like to update anything else?"
-            )
+            if await repository.update_field(
+                update.effective_chat.id, "preference_code", preference_code
+            ):
+                await respond(
+                    update,
+                    f"Your preferences have been updated to: {new_preference_text}. Would you like to update anything else?",
+                    reply_markup=UPDATE_KEYBOARD,
+                )
+            else:
+                await respond(
+                    update,
+                    "No user found. Please start the registration process with /start.",
+                )
         except SQLAlchemyError as e:
-            await update.message.reply_text(
-                "Sorry, there was an error updating your preferences. Please try again."
+            await respond(
+                update,
+                "Sorry, there was an error updating your preferences. Please try again.",
             )
-        finally:
-            Session.remove()
         return UPDATE_CHOICE
     else:
-        await update.message.reply_text(
-            "It seems like you entered an invalid option. Please select from the following options:\n"
-            "1. Use AI to strategize where to apply\n"
-            "2. Help with SAT / ACT preparation\n"
-            "3. Assistance with writing essays\n"
-            "4. Affordable mentorship\n"
-            "Please type the number of your choice."
+        await respond(
+            update,
+            "It seems like you entered an invalid option. Please choose one of the options below.",
+            reply_markup=PREFERENCE_KEYBOARD,
         )
         return UPDATE_PREFERENCES
 
 
+@coalesce_replies
 async def update_bio(update: Update, context: CallbackContext) -> int:
-    session = Session()
     try:
-        user = (
-            session.query(User)
-            .filter(User.chat_id == str(update.effective_chat.id))
-            .first()
-        )
-        user.bio = update.message.text
-        session.commit()
-        await update.message.reply_text(
-            "Your bio has been updated. Would you like to update anything else? If not, type Done."
-        )
+        if await repository.update_field(
+            update.effective_chat.id, "bio", update.message.text
+        ):
+            await reply(
+                update,
+                "Your bio has been updated. Would you like to update anything else? If not, type Done.",
+                reply_markup=UPDATE_KEYBOARD,
+            )
+        else:
+            await reply(
+                update,
+                "No user found. Please start the registration process with /start.",
+            )
     except SQLAlchemyError as e:
-        await update.message.reply_text("Sorry, there was an error updating your bio.")
-    finally:
-        Session.remove()
+        await reply(update, "Sorry, there was an error updating your bio.")
     return UPDATE_CHOICE
 
 
 # Define a cancel function to allow users to stop the conversation
+@coalesce_replies
 async def cancel(update: Update, context: CallbackContext) -> int:
-    await update.message.reply_text(
-        "Update process canceled. You can start again with /start or /update."
+    if context.user_data.registering:
+        registrations.inc("abandoned")
+    await reply(
+        update,
+        "Update process canceled. You can start again with /start or /update.",
     )
     await show_commands(update)  # Show available commands after canceling
     return ConversationHandler.END
\ No newline at end of file
@@ -0,0 +1,194 @@
+# Bulk-imports registrations collected outside the bot (e.g. school fair
+# spreadsheets saved as CSV) into the users table.
+#
+#   python import_users.py signups.csv [--chunk-size 5000]
+#
+# Expected columns: chat_id (optional), first_name, last_name, email, age,
+# school, preferences (option number or text), bio. Rows are validated with
+# the handlers' rules. Rows with a chat_id are upserted on chat_id; rows
+# without one update the registered user with the same email. Schools the
+# catalog (schools.csv) recognizes are stored canonically. Rejected rows
+# go to <input>.rejected.csv with the reason in an "error" column.
+import argparse
+import csv
+import functools
+import sys
+import time
+
+from sqlalchemy import bindparam, func, select, update
+
+from config import Session
+from constants import PREFERENCE_OPTIONS
+from email_utils import is_valid_email
+from models import User
+import repository
+import schools
+from validators import parse_age, parse_preference
+
+IMPORT_CHUNK_SIZE = 5000
+
+PREFERENCE_CODES = {text.lower(): code for code, text in PREFERENCE_OPTIONS.items()}
+PROFILE_FIELDS = [
+    "first_name", "last_name", "age", "school", "school_id", "email", "bio", "preference_code"
+]
+
+
+@functools.lru_cache(maxsize=10000)
+def canonical_school(school):
+    # (name, school_id); imports repeat the same few schools many times
+    match = schools.catalog().canonicalize(school) if school else None
+    return (match.name, match.id) if match else (school, None)
+
+
+def validate(row):
+    # Returns (profile dict, None) or (None, reason)
+    email = (row.get("email") or "").strip()
+    if not is_valid_email(email):
+        return None, "invalid email"
+    age = parse_age((row.get("age") or "").strip())
+    if age is None:
+        return None, "invalid age"
+    preference = (row.get("preferences") or "").strip()
+    preference_code = parse_preference(preference) or PREFERENCE_CODES.get(preference.lower())
+    if preference_code is None:
+        return None, "invalid preference"
+    chat_id = (row.get("chat_id") or "").strip()
+    if chat_id and not chat_id.lstrip("-").isdecimal():
+        return None, "invalid chat_id"
+    school, school_id = canonical_school((row.get("school") or "").strip())
+    return {
+        "chat_id": int(chat_id) if chat_id else None,
+        "first_name": (row.get("first_name") or "").strip().title(),
+        "last_name": (row.get("last_name") or "").strip().title(),
+        "age": age,
+        "school": school,
+        "school_id": school_id,
+        "email": email,
+        "bio": (row.get("bio") or "").strip(),
+        "preference_code": preference_code,
+    }, None
+
+
+def _upsert_statement(bind):
+    statement = repository.insert(User.__table__, bind)
+    return statement.on_conflict_do_update(
+        index_elements=["chat_id"],
+        set_={field: statement.excluded[field] for field in PROFILE_FIELDS},
+    )
+
+
+def _update_by_email_statement():
+    table = User.__table__
+    return (
+        update(table)
+        .where(func.lower(table.c.email) == bindparam("match_email"))
+        .values({field: bindparam(field) for field in PROFILE_FIELDS})
+    )
+
+
+def import_chunk(profiles):
+    # Writes one chunk in a single transaction; returns rows that could not
+    # be matched to a user as (profile, reason)
+    by_chat_id = [profile for profile in profiles if profile["chat_id"] is not None]
+    by_email = {
+        profile["email"].lower(): profile
+        for profile in profiles
+        if profile["chat_id"] is None
+    }
+    rejected = []
+    session = Session()
+    try:
+        if by_email:
+            known = set(
+                session.execute(
+                    select(func.lower(User.email)).where(
+                        func.lower(User.email).in_(list(by_email))
+                    )
+                ).scalars()
+            )
+            for email in list(by_email):
+                if email not in known:
+                    rejected.append((by_email.pop(email), "no chat_id and no user with this email"))
+        if by_chat_id:
+            session.execute(_upsert_statement(session.get_bind()), by_chat_id)
+        if by_email:
+            session.execute(
+                _update_by_email_statement(),
+                [
+                    {field: profile[field] for field in PROFILE_FIELDS}
+                    | {"match_email": email}
+                    for email, profile in by_email.items()
+                ],
+            )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        Session.remove()
+    return rejected
+
+
+def import_file(path, chunk_size=IMPORT_CHUNK_SIZE):
+    rejected_path = f"{path}.rejected.csv"
+    imported = rejected = 0
+    with open(path, newline="", encoding="utf-8-sig") as source, open(
+        rejected_path, "w", newline="", encoding="utf-8"
+    ) as rejects:
+        reader = csv.DictReader(source)
+        reject_writer = csv.DictWriter(
+            rejects, fieldnames=[*(reader.fieldnames or []), "error"], extrasaction="ignore"
+        )
+        reject_writer.writeheader()
+
+        def flush(chunk):
+            nonlocal imported, rejected
+            unmatched = import_chunk([profile for profile, _ in chunk])
+            unmatched_ids = {id(profile): reason for profile, reason in unmatched}
+            for profile, row in chunk:
+                if id(profile) in unmatched_ids:
+                    reject_writer.writerow({**row, "error": unmatched_ids[id(profile)]})
+                    rejected += 1
+                else:
+                    imported += 1
+
+        chunk = []
+        for row in reader:
+            profile, error = validate(row)
+            if error:
+                reject_writer.writerow({**row, "error": error})
+                rejected += 1
+                continue
+            chunk.append((profile, row))
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    return imported, rejected, rejected_path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help="CSV file with one registration per row")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    from config import engine
+    from models import initialize_database
+
+    initialize_database(engine)
+    started = time.perf_counter()
+    imported, rejected, rejected_path = import_file(args.path, args.chunk_size)
+    elapsed = time.perf_counter() - started
+    print(
+        f"Imported {imported} rows, rejected {rejected} in {elapsed:.1f}s "
+        f"({(imported + rejected) / max(elapsed, 1e-9):.0f} rows/s)",
+        file=sys.stderr,
+    )
+    if rejected:
+        print(f"Rejected rows written to {rejected_path}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
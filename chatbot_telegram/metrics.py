@@ -0,0 +1,276 @@
+import asyncio
+import bisect
+import functools
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))  # 0 turns the endpoint off
+
+# Seconds; covers a cached reply (~10us) up to a stuck Bot API call
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+# Minimal Prometheus text-format metrics. Recording is a dict lookup and an
+# addition under a lock (SQL timings arrive from the repository threads);
+# all formatting happens when the endpoint is scraped.
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for label_values, value in values:
+            yield f"{self.name}{_labels(self.labels, label_values)} {value}"
+
+
+class Gauge:
+    # Read at scrape time from a callable, so nothing runs per update. With
+    # labels, the callable returns {label values: value}.
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.function = None
+
+    def set_function(self, function):
+        self.function = function
+
+    def collect(self):
+        if self.function is None:
+            return
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        if not self.labels:
+            yield f"{self.name} {self.function()}"
+            return
+        for label_values, value in self.function().items():
+            yield f"{self.name}{_labels(self.labels, label_values)} {value}"
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [count per bucket (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, seconds, *label_values):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += seconds
+
+    def totals(self):
+        # label values -> (count, sum)
+        with self._lock:
+            return {
+                values: (sum(counts), total)
+                for values, (counts, total) in self._series.items()
+            }
+
+    def collect(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(values, counts[:], total) for values, (counts, total) in self._series.items()]
+        for label_values, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                labels = _labels(self.labels + ("le",), label_values + (bound,))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+handler_seconds = Histogram(
+    "getin_handler_seconds",
+    "Time spent in a conversation handler",
+    ("handler", "state"),
+)
+sql_seconds = Histogram(
+    "getin_sql_seconds", "Time spent executing SQL statements", ("statement",)
+)
+outbound_seconds = Histogram(
+    "getin_outbound_seconds", "Bot API call latency, excluding throttling", ("endpoint",)
+)
+update_queue_depth = Gauge("getin_update_queue_depth", "Updates waiting to be processed")
+updates_running = Gauge("getin_updates_running", "Updates being processed")
+updates_waiting = Gauge(
+    "getin_updates_waiting", "Updates waiting behind an earlier update of their chat"
+)
+write_behind_pending = Gauge(
+    "getin_write_behind_pending", "Profile writes waiting for the next write-behind batch"
+)
+write_behind_batches = Gauge(
+    "getin_write_behind_batches", "Write-behind batches flushed since start"
+)
+write_behind_rows = Gauge(
+    "getin_write_behind_rows", "Profile writes flushed through write-behind since start"
+)
+write_behind_max_batch = Gauge(
+    "getin_write_behind_max_batch_size", "Largest write-behind batch since start"
+)
+write_behind_failed = Gauge(
+    "getin_write_behind_failed", "Write-behind statements that failed on their own retry"
+)
+loop_lag_seconds = Histogram(
+    "getin_event_loop_lag_seconds", "How late the event loop woke a sleeping task"
+)
+conversations = Gauge(
+    "getin_conversations", "Open conversations, as of the last sweep", ("state",)
+)
+conversation_bytes = Gauge(
+    "getin_conversation_draft_bytes",
+    "Approximate memory held by the drafts of open conversations",
+    ("state",),
+)
+conversations_evicted = Counter(
+    "getin_conversations_evicted_total",
+    "Conversations ended by the state store, by reason: idle or capacity",
+    ("reason",),
+)
+flood_dropped = Counter(
+    "getin_flood_dropped_total",
+    "Updates dropped before the handlers, by reason: rate, duplicate or oversize",
+    ("reason",),
+)
+registrations = Counter(
+    "getin_registrations_total",
+    "Registrations by outcome: started, completed or abandoned",
+    ("outcome",),
+)
+
+REGISTRY = [
+    handler_seconds,
+    sql_seconds,
+    outbound_seconds,
+    update_queue_depth,
+    updates_running,
+    updates_waiting,
+    write_behind_pending,
+    write_behind_batches,
+    write_behind_rows,
+    write_behind_max_batch,
+    write_behind_failed,
+    loop_lag_seconds,
+    conversations,
+    conversation_bytes,
+    conversations_evicted,
+    flood_dropped,
+    registrations,
+]
+
+
+def render():
+    lines = [line for metric in REGISTRY for line in metric.collect()]
+    return "\n".join(lines) + "\n"
+
+
+def time_handler(callback, state):
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        finally:
+            handler_seconds.observe(
+                time.perf_counter() - started, callback.__name__, state
+            )
+
+    return wrapper
+
+
+def instrument_engine(engine):
+    # Times every statement by its verb (SELECT, INSERT, ...), which keeps
+    # the number of series small whatever the queries look like
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    verb = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    sql_seconds.observe(time.perf_counter() - started, verb)
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+
+async def start_server(host=METRICS_LISTEN, port=METRICS_PORT):
+    # Serves GET /metrics. A full HTTP server would be overkill for one
+    # plain-text page, and this one runs on the bot's own event loop.
+    async def handle(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass  # Headers are not needed
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1] == b"/metrics":
+                body = render().encode()
+                status = b"200 OK"
+            else:
+                body = b""
+                status = b"404 Not Found"
+            writer.write(
+                b"HTTP/1.1 " + status + b"\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+                b"Connection: close\r\n\r\n" + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info("Serving metrics on http://%s:%s/metrics", host, port)
+    return server
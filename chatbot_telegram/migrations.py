@@ -0,0 +1,239 @@
+import logging
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import DBAPIError
+
+from constants import AGE_BUCKET_OLDEST, AGE_BUCKETS, PREFERENCE_OPTIONS
+from models import (
+    Base,
+    Broadcast,
+    BroadcastDelivery,
+    ConversationState,
+    Preference,
+    StoredUserData,
+    UserStat,
+)
+
+logger = logging.getLogger(__name__)
+
+# Version 1 is the original schema: surrogate id, string chat_id and the full
+# preference sentence on every row.
+LEGACY_VERSION = 1
+
+
+def _seed_preferences(connection):
+    existing = {row.code for row in connection.execute(Preference.__table__.select())}
+    rows = [
+        {"code": code, "text": option}
+        for code, option in PREFERENCE_OPTIONS.items()
+        if code not in existing
+    ]
+    if rows:
+        connection.execute(Preference.__table__.insert(), rows)
+
+
+def _compact_users(connection):
+    # Rebuilds users with an integer chat_id primary key and a preference
+    # code, then adds the email and school indexes.
+    Preference.__table__.create(connection, checkfirst=True)
+    _seed_preferences(connection)
+    connection.execute(text("ALTER TABLE users RENAME TO users_v1"))
+    Base.metadata.tables["users"].create(connection)
+    connection.execute(
+        text(
+            "INSERT INTO users (chat_id, first_name, last_name, age, school, email, bio, preference_code) "
+            "SELECT CAST(u.chat_id AS BIGINT), u.first_name, u.last_name, u.age, u.school, u.email, u.bio, p.code "
+            "FROM users_v1 u LEFT JOIN preferences p ON p.text = u.preferences "
+            "WHERE u.chat_id IS NOT NULL"
+        )
+    )
+    connection.execute(text("DROP TABLE users_v1"))
+
+
+def _add_persistence_tables(connection):
+    ConversationState.__table__.create(connection, checkfirst=True)
+    StoredUserData.__table__.create(connection, checkfirst=True)
+
+
+def _add_broadcast_tables(connection):
+    Broadcast.__table__.create(connection, checkfirst=True)
+    BroadcastDelivery.__table__.create(connection, checkfirst=True)
+
+
+# External-content FTS5 index over users.bio and users.school, kept in sync by
+# triggers so every write path (handlers, write-behind, bulk import) updates
+# it. The rowid is users.chat_id.
+SEARCH_INDEX_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "bio, school, content='users', content_rowid='chat_id')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts (rowid, bio, school) VALUES (new.chat_id, new.bio, new.school); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts (users_fts, rowid, bio, school) "
+    "VALUES ('delete', old.chat_id, old.bio, old.school); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF bio, school ON users BEGIN "
+    "INSERT INTO users_fts (users_fts, rowid, bio, school) "
+    "VALUES ('delete', old.chat_id, old.bio, old.school); "
+    "INSERT INTO users_fts (rowid, bio, school) VALUES (new.chat_id, new.bio, new.school); "
+    "END",
+]
+
+
+def _add_search_index(connection):
+    if connection.dialect.name != "sqlite":
+        return  # FTS5 is SQLite only; search.py falls back to LIKE elsewhere
+    for statement in SEARCH_INDEX_DDL:
+        connection.execute(text(statement))
+    connection.execute(text("INSERT INTO users_fts (users_fts) VALUES ('rebuild')"))
+
+
+# Registration counters in user_stats, kept by triggers so they change in the
+# same transaction as the users row, whichever path writes it. An insert is a
+# completed registration and also counts towards today's date; re-registering
+# (an upsert on an existing row) only moves the changed buckets.
+STATS_COLUMNS = {"preference": "preference_code", "school": "school", "age": "age"}
+
+
+def _age_bucket_sql(age):
+    cases = " ".join(f"WHEN {age} <= {oldest} THEN '{label}'" for oldest, label in AGE_BUCKETS)
+    return f"CASE WHEN {age} IS NULL THEN 'unknown' {cases} ELSE '{AGE_BUCKET_OLDEST}' END"
+
+
+def _count_sql(rows):
+    # rows: (dimension, bucket expression, delta)
+    values = ", ".join(f"('{dimension}', {bucket}, {delta})" for dimension, bucket, delta in rows)
+    return (
+        f"INSERT INTO user_stats (dimension, bucket, count) VALUES {values} "
+        "ON CONFLICT (dimension, bucket) DO UPDATE SET count = count + excluded.count; "
+    )
+
+
+def _bucket_sql(dimension, row):
+    column = f"{row}.{STATS_COLUMNS[dimension]}"
+    return _age_bucket_sql(column) if dimension == "age" else f"coalesce({column}, '')"
+
+
+STATS_TRIGGERS_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS user_stats_insert AFTER INSERT ON users BEGIN "
+    + _count_sql(
+        [("total", "''", 1)]
+        + [(dimension, _bucket_sql(dimension, "new"), 1) for dimension in STATS_COLUMNS]
+        + [("day", "date('now')", 1)]
+    )
+    + "END",
+    "CREATE TRIGGER IF NOT EXISTS user_stats_delete AFTER DELETE ON users BEGIN "
+    + _count_sql(
+        [("total", "''", -1)]
+        + [(dimension, _bucket_sql(dimension, "old"), -1) for dimension in STATS_COLUMNS]
+    )
+    + "END",
+] + [
+    f"CREATE TRIGGER IF NOT EXISTS user_stats_update_{dimension} "
+    f"AFTER UPDATE OF {column} ON users WHEN old.{column} IS NOT new.{column} BEGIN "
+    + _count_sql(
+        [
+            (dimension, _bucket_sql(dimension, "old"), -1),
+            (dimension, _bucket_sql(dimension, "new"), 1),
+        ]
+    )
+    + "END"
+    for dimension, column in STATS_COLUMNS.items()
+]
+
+
+def _add_user_stats(connection):
+    UserStat.__table__.create(connection, checkfirst=True)
+    if connection.dialect.name != "sqlite":
+        return  # No triggers elsewhere; stats.py counts the users table instead
+    for statement in STATS_TRIGGERS_DDL:
+        connection.execute(text(statement))
+    # Backfill from the existing rows. There is no registration date, so
+    # the day counters start empty.
+    connection.execute(text("DELETE FROM user_stats WHERE dimension != 'day'"))
+    for dimension in ["total", *STATS_COLUMNS]:
+        bucket = "''" if dimension == "total" else _bucket_sql(dimension, "users")
+        connection.execute(
+            text(
+                "INSERT INTO user_stats (dimension, bucket, count) "
+                f"SELECT '{dimension}', {bucket}, count(*) FROM users GROUP BY 2"
+            )
+        )
+
+
+def _add_school_id(connection):
+    # Version 1 databases get the column when _compact_users recreates users
+    columns = {column["name"] for column in inspect(connection).get_columns("users")}
+    if "school_id" not in columns:
+        connection.execute(text("ALTER TABLE users ADD COLUMN school_id INTEGER"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_users_school_id ON users (school_id)"))
+
+
+# (version, description, upgrade function); append new steps at the end
+MIGRATIONS = [
+    (2, "compact users schema", _compact_users),
+    (3, "conversation persistence tables", _add_persistence_tables),
+    (4, "broadcast tables", _add_broadcast_tables),
+    (5, "full-text search index", _add_search_index),
+    (6, "registration statistics", _add_user_stats),
+    (7, "canonical school id", _add_school_id),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def _ensure_version_table(connection):
+    connection.execute(
+        text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    )
+
+
+def get_version(connection):
+    tables = inspect(connection).get_table_names()
+    if "schema_version" in tables:
+        version = connection.execute(text("SELECT version FROM schema_version")).scalar()
+        if version is not None:
+            return version
+    if "users" in tables:
+        return LEGACY_VERSION
+    return 0
+
+
+def _set_version(connection, version):
+    connection.execute(text("DELETE FROM schema_version"))
+    connection.execute(
+        text("INSERT INTO schema_version (version) VALUES (:version)"),
+        {"version": version},
+    )
+
+
+def _current_version(engine):
+    try:
+        with engine.connect() as connection:
+            return connection.execute(text("SELECT version FROM schema_version")).scalar()
+    except DBAPIError:
+        return None  # No version table yet
+
+
+def migrate(engine):
+    # A restart on an up-to-date database costs one SELECT: no reflection,
+    # no DDL and no write transaction
+    if _current_version(engine) == SCHEMA_VERSION:
+        return
+    with engine.begin() as connection:
+        _ensure_version_table(connection)
+        version = get_version(connection)
+        if version == 0:
+            # Fresh database: create the current schema directly
+            Base.metadata.create_all(connection)
+            _add_search_index(connection)
+            _add_user_stats(connection)
+            _seed_preferences(connection)
+            _set_version(connection, SCHEMA_VERSION)
+            return
+        for target, description, upgrade in MIGRATIONS:
+            if target > version:
+                logger.info("Migrating schema to version %d: %s", target, description)
+                upgrade(connection)
+                _set_version(connection, target)
@@ -1,19 +1,95 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    ForeignKey,
+    Index,
+    Integer,
+    SmallInteger,
+    String,
+    Text,
+    func,
+)
 from sqlalchemy.orm import declarative_base
 
 Base = declarative_base()
 
+# Telegram chat IDs are 64-bit. On SQLite the column is declared INTEGER so
+# it becomes an alias of the rowid instead of a separate unique index.
+ChatId = BigInteger().with_variant(Integer, "sqlite")
+
+
+class Preference(Base):
+    __tablename__ = "preferences"
+    code = Column(SmallInteger, primary_key=True, autoincrement=False)
+    text = Column(String, nullable=False)
+
+
 class User(Base):
     __tablename__ = "users"
-    id = Column(Integer, primary_key=True)
-    chat_id = Column(String, unique=True)
+    chat_id = Column(ChatId, primary_key=True, autoincrement=False)
     first_name = Column(String)
     last_name = Column(String)
     age = Column(Integer)
     school = Column(String)
     email = Column(String)
     bio = Column(String)
-    preferences = Column(String)
+    preference_code = Column(SmallInteger, ForeignKey("preferences.code"))
+    # schools.csv id when school matched the catalog; school then holds the
+    # canonical name. None for names the catalog does not know.
+    school_id = Column(Integer)
+
+    __table_args__ = (
+        Index("ix_users_email_lower", func.lower(email)),
+        Index("ix_users_school", school),
+        Index("ix_users_school_id", school_id),
+    )
+
+
+class ConversationState(Base):
+    # One row per open conversation; ended conversations are deleted
+    __tablename__ = "conversation_states"
+    name = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)  # JSON-encoded conversation key
+    state = Column(Integer, nullable=False)
+
+
+class StoredUserData(Base):
+    __tablename__ = "user_data"
+    user_id = Column(ChatId, primary_key=True, autoincrement=False)
+    data = Column(String, nullable=False)  # JSON-encoded context.user_data
+
+
+class UserStat(Base):
+    # Registration counters, maintained by triggers on users (see
+    # migrations.STATS_TRIGGERS_DDL). dimension is total, preference, school,
+    # age or day; day counts registrations completed on each UTC date.
+    __tablename__ = "user_stats"
+    dimension = Column(String, primary_key=True)
+    bucket = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+    id = Column(Integer, primary_key=True)
+    text = Column(Text, nullable=False)
+    preference_code = Column(SmallInteger)  # Segment filters; None means all
+    school = Column(String)
+    status = Column(String, nullable=False, default="running")
+    last_chat_id = Column(ChatId)  # Checkpoint: everyone up to here is done
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+
+
+class BroadcastDelivery(Base):
+    __tablename__ = "broadcast_deliveries"
+    broadcast_id = Column(Integer, ForeignKey("broadcasts.id"), primary_key=True)
+    chat_id = Column(ChatId, primary_key=True, autoincrement=False)
+    status = Column(String, nullable=False)  # sent, blocked or failed
+    error = Column(String)
+
 
 def initialize_database(engine):
-    Base.metadata.create_all(engine)
+    from migrations import migrate
+
+    migrate(engine)
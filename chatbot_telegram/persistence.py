@@ -0,0 +1,232 @@
+import asyncio
+import json
+import logging
+import os
+
+from sqlalchemy import bindparam, delete, select
+from telegram.ext import BasePersistence, PersistenceInput
+
+from config import Session
+from models import ConversationState, StoredUserData
+import repository
+
+logger = logging.getLogger(__name__)
+
+PERSISTENCE_FLUSH_INTERVAL = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "1"))
+PERSISTENCE_BATCH_SIZE = int(os.getenv("PERSISTENCE_BATCH_SIZE", "500"))
+
+_DELETED = object()
+
+
+class SQLitePersistence(BasePersistence):
+    # Stores ConversationHandler states and user_data in the bot database.
+    #
+    # The Application only hands over chats that changed, and those are kept
+    # in memory until the next batch write, so an update costs no I/O. Each
+    # user's user_data is read on first access (refresh_user_data) rather
+    # than at startup. Only the small state table is loaded eagerly, because
+    # ConversationHandler needs it before it can route the first update.
+
+    def __init__(
+        self,
+        update_interval=5,
+        flush_interval=PERSISTENCE_FLUSH_INTERVAL,
+        batch_size=PERSISTENCE_BATCH_SIZE,
+    ):
+        super().__init__(
+            store_data=PersistenceInput(
+                bot_data=False, chat_data=False, user_data=True, callback_data=False
+            ),
+            update_interval=update_interval,
+        )
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._pending_users = {}
+        self._pending_states = {}
+        self._loaded_users = set()
+        self._writer = None
+        self._write_lock = asyncio.Lock()  # Keeps batches in commit order
+
+    # Loading
+
+    async def get_user_data(self):
+        return {}  # Loaded per user in refresh_user_data
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        await repository.wait_for_schema()  # First database read at startup
+        return await repository.run_in_db(self._load_conversations, name)
+
+    @staticmethod
+    def _load_conversations(name):
+        session = Session()
+        try:
+            rows = session.execute(
+                select(ConversationState.key, ConversationState.state).where(
+                    ConversationState.name == name
+                )
+            )
+            return {tuple(json.loads(key)): state for key, state in rows}
+        finally:
+            Session.remove()
+
+    @staticmethod
+    def _load_user_data(user_id):
+        session = Session()
+        try:
+            data = session.execute(
+                select(StoredUserData.data).where(StoredUserData.user_id == user_id)
+            ).scalar()
+            return json.loads(data) if data else {}
+        finally:
+            Session.remove()
+
+    async def refresh_user_data(self, user_id, user_data):
+        if user_id in self._loaded_users:
+            return
+        self._loaded_users.add(user_id)
+        if user_id in self._pending_users:
+            return  # Memory already holds newer data than the database
+        stored = await repository.run_in_db(self._load_user_data, user_id)
+        user_data.load(stored)
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    # Buffered writes
+
+    async def update_user_data(self, user_id, data):
+        # data is a state_store.Draft; stored as a JSON object of its set fields
+        self._loaded_users.add(user_id)
+        fields = data.to_dict()
+        self._pending_users[user_id] = json.dumps(fields) if fields else _DELETED
+        await self._schedule_write()
+
+    async def drop_user_data(self, user_id):
+        self._loaded_users.discard(user_id)
+        self._pending_users[user_id] = _DELETED
+        await self._schedule_write()
+
+    async def update_conversation(self, name, key, new_state):
+        state = _DELETED if new_state is None else new_state
+        self._pending_states[(name, json.dumps(list(key)))] = state
+        await self._schedule_write()
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def _schedule_write(self):
+        if len(self._pending_users) + len(self._pending_states) >= self.batch_size:
+            await self._write_pending()
+        elif self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_later())
+
+    async def _write_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await asyncio.shield(self._write_pending())
+
+    async def _write_pending(self):
+        async with self._write_lock:
+            users, self._pending_users = self._pending_users, {}
+            states, self._pending_states = self._pending_states, {}
+            if not users and not states:
+                return
+            try:
+                await repository.run_in_db(self._write, users, states)
+            except Exception:
+                logger.exception(
+                    "Failed to persist %d conversation changes", len(users) + len(states)
+                )
+                # Keep the changes for the next attempt unless newer ones arrived
+                for user_id, data in users.items():
+                    self._pending_users.setdefault(user_id, data)
+                for key, state in states.items():
+                    self._pending_states.setdefault(key, state)
+
+    @staticmethod
+    def _write(users, states):
+        # One transaction per batch, using executemany for each statement
+        session = Session()
+        try:
+            upsert_users = [
+                {"user_id": user_id, "data": data}
+                for user_id, data in users.items()
+                if data is not _DELETED
+            ]
+            deleted_users = [
+                {"id": user_id} for user_id, data in users.items() if data is _DELETED
+            ]
+            upsert_states = [
+                {"name": name, "key": key, "state": state}
+                for (name, key), state in states.items()
+                if state is not _DELETED
+            ]
+            deleted_states = [
+                {"n": name, "k": key}
+                for (name, key), state in states.items()
+                if state is _DELETED
+            ]
+            if upsert_users:
+                statement = repository.insert(StoredUserData.__table__, session.get_bind())
+                session.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["user_id"],
+                        set_={"data": statement.excluded.data},
+                    ),
+                    upsert_users,
+                )
+            if deleted_users:
+                session.execute(
+                    delete(StoredUserData.__table__).where(
+                        StoredUserData.__table__.c.user_id == bindparam("id")
+                    ),
+                    deleted_users,
+                )
+            if upsert_states:
+                statement = repository.insert(ConversationState.__table__, session.get_bind())
+                session.execute(
+                    statement.on_conflict_do_update(
+                        index_elements=["name", "key"],
+                        set_={"state": statement.excluded.state},
+                    ),
+                    upsert_states,
+                )
+            if deleted_states:
+                session.execute(
+                    delete(ConversationState.__table__).where(
+                        ConversationState.__table__.c.name == bindparam("n"),
+                        ConversationState.__table__.c.key == bindparam("k"),
+                    ),
+                    deleted_states,
+                )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            Session.remove()
+
+    async def flush(self):
+        if self._writer is not None and not self._writer.done():
+            self._writer.cancel()  # A write already in progress is shielded
+        await self._write_pending()
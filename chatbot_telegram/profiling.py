@@ -0,0 +1,230 @@
+import asyncio
+import collections
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+from sqlalchemy import event
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_SECONDS = int(os.getenv("PROFILE_SECONDS", "30"))  # For SIGUSR1
+PROFILE_MAX_SECONDS = 300
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100"))  # 0 turns it off
+LOOP_LAG_INTERVAL = 0.05
+TOP_ENTRIES = 5
+
+
+def _collapse(thread_name, frame):
+    # One line of Brendan Gregg's collapsed format: root;...;leaf
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    names.append(thread_name)
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    # Samples the stack of every thread (the event loop and the repository
+    # workers) from a background thread. Nothing is hooked into the code
+    # being profiled, so the cost is the sampling itself and it stays off
+    # until someone asks for a profile.
+
+    def __init__(self, interval=PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident != me:
+                    self.stacks[_collapse(names.get(ident, str(ident)), frame)] += 1
+            self.samples += 1
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class StatementTimer:
+    # Cumulative time per SQL statement; statements are parameterized, so
+    # every call of the same query lands on the same key. It is attached to
+    # a live engine: statements already running at start() have no start
+    # time and are skipped, and start times are kept under a key of this
+    # timer's own, so ones left behind by stop() never reach another one.
+    def __init__(self, engine):
+        self.engine = engine
+        self.totals = collections.defaultdict(lambda: [0, 0.0])
+        self._lock = threading.Lock()
+        self._key = f"profile_started_{id(self)}"
+
+    def start(self):
+        event.listen(self.engine, "before_cursor_execute", self._before)
+        event.listen(self.engine, "after_cursor_execute", self._after)
+        event.listen(self.engine, "handle_error", self._handle_error)
+
+    def stop(self):
+        event.remove(self.engine, "before_cursor_execute", self._before)
+        event.remove(self.engine, "after_cursor_execute", self._after)
+        event.remove(self.engine, "handle_error", self._handle_error)
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(self._key, []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get(self._key)
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        key = " ".join(statement.split())
+        with self._lock:
+            total = self.totals[key]
+            total[0] += 1
+            total[1] += elapsed
+
+    def _handle_error(self, exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get(self._key):
+            connection.info[self._key].pop()
+
+
+_running = False
+
+
+async def profile(seconds, engine):
+    # Profiles the whole bot for the given time, writes the samples to a
+    # collapsed-stack file (flamegraph.pl / speedscope) and returns a report
+    global _running
+    if _running:
+        raise RuntimeError("A profile is already running")
+    _running = True
+    profiler = SamplingProfiler()
+    statements = StatementTimer(engine)
+    handlers_before = metrics.handler_seconds.totals()
+    try:
+        statements.start()
+        profiler.start()
+        await asyncio.sleep(seconds)
+    finally:
+        profiler.stop()
+        statements.stop()
+        _running = False
+    handlers_after = metrics.handler_seconds.totals()
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+    await asyncio.to_thread(profiler.write, path)
+
+    handler_times = []
+    for labels, (count, total) in handlers_after.items():
+        before_count, before_total = handlers_before.get(labels, (0, 0.0))
+        if count > before_count:
+            handler_times.append((total - before_total, count - before_count, labels))
+    handler_times.sort(reverse=True)
+    sql_times = sorted(
+        ((total, count, statement) for statement, (count, total) in statements.totals.items()),
+        reverse=True,
+    )
+
+    lines = [f"Profile of {seconds}s, {profiler.samples} samples: {path}", "Top handlers:"]
+    for total, count, (handler, state) in handler_times[:TOP_ENTRIES]:
+        lines.append(f"  {total:.3f}s in {count} calls: {handler} ({state})")
+    lines.append("Top SQL statements:")
+    for total, count, statement in sql_times[:TOP_ENTRIES]:
+        lines.append(f"  {total:.3f}s in {count} calls: {statement[:120]}")
+    return "\n".join(lines)
+
+
+def install_signal_handler(engine, seconds=PROFILE_SECONDS):
+    # kill -USR1 <pid> profiles the bot and logs the report
+    if not hasattr(signal, "SIGUSR1"):
+        return
+    loop = asyncio.get_running_loop()
+
+    async def run():
+        try:
+            logger.warning("%s", await profile(seconds, engine))
+        except RuntimeError as e:
+            logger.warning("%s", e)
+
+    loop.add_signal_handler(signal.SIGUSR1, lambda: loop.create_task(run()))
+
+
+class LoopLagMonitor:
+    # A coroutine stamps a heartbeat every LOOP_LAG_INTERVAL. If a handler
+    # blocks the loop (e.g. a synchronous Session call), a watchdog thread
+    # sees the heartbeat go stale and captures the loop thread's stack while
+    # it is still blocked; when the loop recovers, the stall is logged with
+    # that stack.
+
+    def __init__(self, threshold_ms=LOOP_LAG_THRESHOLD_MS, interval=LOOP_LAG_INTERVAL):
+        self.threshold = threshold_ms / 1000
+        self.interval = interval
+        self.stalls = 0
+        self._heartbeat = time.monotonic()
+        self._blocked_stack = None
+        self._loop_thread = None
+        self._task = None
+        self._stop = threading.Event()
+        self._watchdog = None
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._task = asyncio.get_running_loop().create_task(self._beat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _beat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            self._heartbeat = expected
+            await asyncio.sleep(self.interval)
+            lag = time.monotonic() - expected
+            metrics.loop_lag_seconds.observe(max(lag, 0.0))
+            stack, self._blocked_stack = self._blocked_stack, None
+            if lag > self.threshold:
+                self.stalls += 1
+                logger.warning(
+                    "Event loop blocked for %.0fms%s",
+                    lag * 1000,
+                    f" in:\n{stack}" if stack else "",
+                )
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 2):
+            if self._blocked_stack is None and time.monotonic() - self._heartbeat > self.threshold:
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is not None:
+                    self._blocked_stack = "".join(traceback.format_stack(frame, limit=8))
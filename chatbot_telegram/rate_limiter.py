@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from metrics import outbound_seconds
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows about 30 messages per second overall and about one per
+# second in a single chat, with short bursts tolerated.
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = float(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+# Share of the global rate that bulk sends (broadcasts) may not use, so
+# conversation replies keep flowing while a broadcast runs
+OUTBOUND_REPLY_SHARE = float(os.getenv("OUTBOUND_REPLY_SHARE", "0.3"))
+MAX_TRACKED_CHATS = 10000
+
+# Bot API methods that are not subject to the message limits
+UNLIMITED_ENDPOINTS = {"getUpdates", "getMe", "setWebhook", "deleteWebhook"}
+# Bot API methods that send nothing to the chat, so skip its bucket
+CHAT_UNLIMITED_ENDPOINTS = {"answerCallbackQuery"}
+
+# rate_limit_args marking a send as bulk, e.g.
+# bot.send_message(..., rate_limit_args=BULK)
+BULK = {"bulk": True}
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        # Takes a token if one is available, else returns the seconds to wait
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    async def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class TokenBucketRateLimiter(BaseRateLimiter):
+    # Throttles outgoing Bot API calls with one global bucket plus a bucket
+    # per chat, and retries calls Telegram rejects with RetryAfter. While a
+    # RetryAfter is pending, every request waits, since flood control
+    # applies to the whole bot. Bulk sends also take a token from a bucket
+    # refilled at (1 - reply_share) of the global rate, so they can never use
+    # the reply share of the global bucket.
+    #
+    # rate_limit_args, when given, is a dict with optional keys "bulk" and
+    # "max_retries".
+
+    def __init__(
+        self,
+        global_rate=OUTBOUND_GLOBAL_RATE,
+        chat_rate=OUTBOUND_CHAT_RATE,
+        chat_burst=OUTBOUND_CHAT_BURST,
+        max_retries=OUTBOUND_MAX_RETRIES,
+        reply_share=OUTBOUND_REPLY_SHARE,
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        bulk_rate = global_rate * (1 - reply_share)
+        self.bulk_bucket = TokenBucket(bulk_rate, bulk_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self._chat_buckets = OrderedDict()
+        self._retry_after = asyncio.Event()
+        self._retry_after.set()
+        self.throttled = 0
+        self.retries = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(
+                self.chat_rate, self.chat_burst
+            )
+            if len(self._chat_buckets) > MAX_TRACKED_CHATS:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def _acquire(self, chat_id, bulk):
+        if chat_id is not None:
+            bucket = self._chat_bucket(chat_id)
+            if bucket.try_acquire():
+                self.throttled += 1
+                await bucket.acquire()
+        if bulk and self.bulk_bucket.try_acquire():
+            self.throttled += 1
+            await self.bulk_bucket.acquire()
+        if self.global_bucket.try_acquire():
+            self.throttled += 1
+            await self.global_bucket.acquire()
+
+    async def process_request(
+        self, callback, args, kwargs, endpoint, data, rate_limit_args
+    ):
+        if endpoint in UNLIMITED_ENDPOINTS:
+            return await callback(*args, **kwargs)
+
+        chat_id = None if endpoint in CHAT_UNLIMITED_ENDPOINTS else data.get("chat_id")
+        options = rate_limit_args or {}
+        max_retries = options.get("max_retries", self.max_retries)
+        bulk = options.get("bulk", False)
+        for attempt in range(max_retries + 1):
+            await self._retry_after.wait()
+            await self._acquire(chat_id, bulk)
+            started = time.perf_counter()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == max_retries:
+                    raise
+                self.retries += 1
+                logger.warning(
+                    "Flood limit hit on %s, retrying in %ss", endpoint, e.retry_after
+                )
+                self._retry_after.clear()
+                await asyncio.sleep(e.retry_after + 0.1)
+                self._retry_after.set()
+            finally:
+                outbound_seconds.observe(time.perf_counter() - started, endpoint)
@@ -0,0 +1,83 @@
+# Opt-in recorder of incoming updates for performance regression testing.
+# With RECORD_UPDATES=<path> the bot writes every update to that file in a
+# compact, anonymized form; benchmarks/replay.py plays it back. Each start
+# begins a new recording, replacing the file: offsets and pseudonyms are
+# only meaningful within one process.
+#
+# Record layout: 4-byte little-endian payload length, 8-byte float seconds
+# since the recording started, then the payload as compact JSON:
+#   {"k": "m" | "c", "c": pseudonymous chat id, "x": text or callback data}
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import struct
+import time
+
+from telegram import Update
+from telegram.ext import CallbackContext
+
+from constants import UPDATE_CHOICES
+
+RECORD_UPDATES = os.getenv("RECORD_UPDATES")
+
+HEADER = struct.Struct("<Id")
+
+# Bot vocabulary survives anonymization so the replay takes the same paths
+KEEP_WORDS = set(UPDATE_CHOICES) | {"done"}
+
+
+def anonymize_text(text):
+    # Masks letters but keeps digits, punctuation, length and commands, so
+    # ages, option numbers and valid/invalid emails replay the same way
+    if text.startswith("/") or text.lower() in KEEP_WORDS:
+        return text
+    text = re.sub(r"[a-z]", "x", text)
+    text = re.sub(r"[A-Z]", "X", text)
+    return re.sub(r"[^\x00-\x7f]", "x", text)
+
+
+class UpdateRecorder:
+    # keep_text(update) -> True records a message's text unmasked. The bot
+    # uses it for school names: the catalog matches them, and masked ones
+    # would take a different path in the replay.
+
+    def __init__(self, path, keep_text=None):
+        self._file = open(path, "wb")
+        self._keep_text = keep_text
+        self._key = secrets.token_bytes(16)  # Pseudonyms differ per recording
+        self._started = time.monotonic()
+        self.recorded = 0
+
+    def pseudonym(self, chat_id):
+        digest = hmac.new(self._key, str(chat_id).encode(), hashlib.sha256).digest()
+        return int.from_bytes(digest[:6], "little") + 1
+
+    async def record(self, update: Update, context: CallbackContext):
+        if update.callback_query is not None:
+            payload = {"k": "c", "x": update.callback_query.data}
+        elif update.message is not None and update.message.text is not None:
+            text = update.message.text
+            if self._keep_text is None or not self._keep_text(update):
+                text = anonymize_text(text)
+            payload = {"k": "m", "x": text}
+        else:
+            return
+        payload["c"] = self.pseudonym(update.effective_chat.id)
+        data = json.dumps(payload, separators=(",", ":")).encode()
+        self._file.write(HEADER.pack(len(data), time.monotonic() - self._started))
+        self._file.write(data)
+        self.recorded += 1
+
+    def close(self):
+        self._file.close()
+
+
+def read_records(path):
+    # Yields (seconds since start, payload dict)
+    with open(path, "rb") as log:
+        while header := log.read(HEADER.size):
+            length, offset = HEADER.unpack(header)
+            yield offset, json.loads(log.read(length))
@@ -0,0 +1,57 @@
+import contextvars
+import functools
+
+MAX_MESSAGE_LENGTH = 4096  # Telegram's limit for one text message
+
+_pending = contextvars.ContextVar("pending_replies", default=None)
+
+
+def coalesce_replies(handler):
+    # Collects the replies a handler sends and delivers them as one message
+    # when it returns. Consecutive texts are joined with a blank line; only a
+    # reply carrying its own options (e.g. a keyboard) starts a new message.
+    @functools.wraps(handler)
+    async def wrapper(update, context):
+        replies = []
+        token = _pending.set(replies)
+        try:
+            return await handler(update, context)
+        finally:
+            _pending.reset(token)
+            await _send(update, replies)
+
+    return wrapper
+
+
+async def reply(update, text, **kwargs):
+    replies = _pending.get()
+    if replies is None:
+        await update.message.reply_text(text, **kwargs)
+        return
+    if kwargs and any(options for _, options in replies):
+        await _send(update, replies)
+        replies.clear()
+    replies.append((text, kwargs))
+
+
+async def respond(update, text, **kwargs):
+    # Button presses edit the message the button belongs to instead of
+    # sending a new one; typed input gets a normal (coalesced) reply.
+    query = update.callback_query
+    if query is None:
+        await reply(update, text, **kwargs)
+        return
+    await query.answer()
+    await query.edit_message_text(text, **kwargs)
+
+
+async def _send(update, replies):
+    if not replies:
+        return
+    text = "\n\n".join(text for text, _ in replies)
+    options = next((options for _, options in replies if options), {})
+    if len(text) <= MAX_MESSAGE_LENGTH:
+        await update.message.reply_text(text, **options)
+        return
+    for text, kwargs in replies:  # Too long to merge; send them one by one
+        await update.message.reply_text(text, **kwargs)
@@ -0,0 +1,252 @@
+import asyncio
+import os
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import fields
+from functools import cache, partial
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import User, initialize_database
+from cache import UserSnapshot, profile_cache
+from config import Session
+
+# SQLite work is synchronous, so it runs on a small dedicated pool instead of
+# the event loop. The pool is bounded to keep lock contention on the database
+# file predictable under load.
+DB_WORKERS = int(os.getenv("DB_WORKERS", "4"))
+
+# Most writes one group commit may hold
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "500"))
+
+_executor = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="db")
+_connections = threading.local()
+_writes = queue.SimpleQueue()  # (statements, Future), or None to stop the writer
+_writer = None
+
+# Set by the bot when write-behind batching is enabled (see write_behind.py)
+write_behind = None
+
+_schema_ready = None
+
+# INSERT ... ON CONFLICT is spelled the same on SQLite and PostgreSQL, but
+# SQLAlchemy only offers on_conflict_do_update() on each dialect's insert()
+_inserts = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+_users = User.__table__
+# Profile reads and writes skip the ORM: their statements are built once
+# with bind parameters, so a call only binds values and runs the cached
+# compiled SQL. This is most of their cost otherwise.
+_select_user = select(*(_users.c[field.name] for field in fields(UserSnapshot))).where(
+    _users.c.chat_id == bindparam("key")
+)
+
+
+def insert(table, bind=None):
+    # An insert() supporting on_conflict_do_update() and
+    # on_conflict_do_nothing() for the dialect of bind (an engine or
+    # connection), by default the engine Session is bound to
+    if bind is None:
+        bind = Session.session_factory.kw["bind"]
+    try:
+        return _inserts[bind.dialect.name](table)
+    except KeyError:
+        raise NotImplementedError(f"No upsert support for {bind.dialect.name}") from None
+
+
+async def run_in_db(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(func, *args, **kwargs))
+
+
+async def run_writes(statements):
+    # Runs (statement, parameters) pairs in one transaction on the writer
+    # thread and returns their rowcounts
+    global _writer
+    if _writer is None:
+        _writer = threading.Thread(target=_write_forever, name="db-writer", daemon=True)
+        _writer.start()
+    future = Future()
+    _writes.put((statements, future))
+    return await asyncio.wrap_future(future)
+
+
+def _write_forever():
+    # Profile writes go to this one thread: SQLite takes one writer at a
+    # time, so writers on several threads would only wait on each other's
+    # lock. Everything queued while a transaction ran is committed together
+    # in the next one (group commit).
+    while True:
+        jobs = [_writes.get()]
+        while len(jobs) < WRITE_BATCH_MAX and not _writes.empty():
+            jobs.append(_writes.get_nowait())
+        stopping = None in jobs
+        jobs = [job for job in jobs if job is not None and job[1].set_running_or_notify_cancel()]
+        if jobs:
+            _commit_jobs(jobs)
+        if stopping:
+            return
+
+
+def _commit_jobs(jobs):
+    # When the shared transaction fails, each job is retried in its own, so
+    # a bad row only fails the caller that sent it
+    try:
+        rowcounts = execute_writes([statement for statements, _ in jobs for statement in statements])
+    except Exception as e:
+        if len(jobs) == 1:
+            jobs[0][1].set_exception(e)
+        else:
+            for job in jobs:
+                _commit_jobs([job])
+        return
+    start = 0
+    for statements, future in jobs:
+        future.set_result(rowcounts[start : start + len(statements)])
+        start += len(statements)
+
+
+def start_schema_check(engine):
+    # Checks or migrates the schema on a database thread, so it overlaps the
+    # Bot API handshake at startup instead of delaying it
+    global _schema_ready
+    _schema_ready = _executor.submit(initialize_database, engine)
+
+
+async def wait_for_schema():
+    if _schema_ready is not None:
+        await asyncio.wrap_future(_schema_ready)
+
+
+def _connection():
+    # Each database thread keeps a connection open to the engine Session is
+    # bound to, instead of checking one out of the pool for every call
+    engine = Session.session_factory.kw["bind"]
+    connection = getattr(_connections, "connection", None)
+    if connection is None or connection.engine is not engine:
+        if connection is not None:
+            connection.close()
+        connection = _connections.connection = engine.connect()
+    return connection
+
+
+def _get_user(chat_id):
+    connection = _connection()
+    try:
+        row = connection.execute(_select_user, {"key": int(chat_id)}).first()
+    finally:
+        connection.rollback()  # Ends the read transaction, so the next read sees new commits
+    return UserSnapshot(*row) if row else None
+
+
+@cache
+def _upsert(columns, bind):
+    # One INSERT ... ON CONFLICT statement, so re-registering or a double
+    # submit overwrites the existing row instead of raising IntegrityError
+    statement = insert(_users, bind)
+    return statement.on_conflict_do_update(
+        index_elements=[_users.c.chat_id],
+        set_={column: statement.excluded[column] for column in columns},
+    )
+
+
+@cache
+def _update(columns):
+    # Single UPDATE ... WHERE chat_id = ?
+    return (
+        update(_users)
+        .where(_users.c.chat_id == bindparam("key"))
+        .values({column: bindparam(column) for column in columns})
+    )
+
+
+def upsert_statement(chat_id, **fields):
+    # (statement, parameters) for execute_writes()
+    statement = _upsert(tuple(sorted(fields)), Session.session_factory.kw["bind"])
+    return statement, {"chat_id": int(chat_id), **fields}
+
+
+def update_fields_statement(chat_id, **values):
+    return _update(tuple(sorted(values))), {"key": int(chat_id), **values}
+
+
+def update_field_statement(chat_id, column, value):
+    return update_fields_statement(chat_id, **{column: value})
+
+
+def execute_writes(statements):
+    # Runs (statement, parameters) pairs in one transaction and returns
+    # their rowcounts
+    connection = _connection()
+    try:
+        rowcounts = [
+            connection.execute(statement, parameters).rowcount
+            for statement, parameters in statements
+        ]
+        connection.commit()
+        return rowcounts
+    except Exception:
+        connection.rollback()
+        raise
+
+
+def _upsert_user(chat_id, **fields):
+    execute_writes([upsert_statement(chat_id, **fields)])
+
+
+def update_user_fields(chat_id, **values):
+    # Returns the number of rows changed
+    return execute_writes([update_fields_statement(chat_id, **values)])[0]
+
+
+def update_user_field(chat_id, column, value):
+    return update_user_fields(chat_id, **{column: value})
+
+
+async def get_user(chat_id):
+    # Read-through: snapshots are cached per chat and dropped on every write
+    key = int(chat_id)
+    user = profile_cache.get(key)
+    if user is None:
+        generation = profile_cache.generation()
+        user = await run_in_db(_get_user, key)
+        if user is not None:
+            profile_cache.put(key, user, generation)
+    return user
+
+
+async def upsert_user(chat_id, **fields):
+    try:
+        if write_behind is not None:
+            await write_behind.submit(upsert_statement(chat_id, **fields))
+        else:
+            await run_writes([upsert_statement(chat_id, **fields)])
+    finally:
+        profile_cache.invalidate(int(chat_id))
+
+
+async def update_fields(chat_id, **values):
+    # Returns False when no registered user matches the chat
+    try:
+        if write_behind is not None:
+            statement = update_fields_statement(chat_id, **values)
+            return await write_behind.submit(statement) > 0
+        rowcounts = await run_writes([update_fields_statement(chat_id, **values)])
+        return rowcounts[0] > 0
+    finally:
+        profile_cache.invalidate(int(chat_id))
+
+
+async def update_field(chat_id, column, value):
+    return await update_fields(chat_id, **{column: value})
+
+
+def shutdown():
+    global _writer
+    if _writer is not None:
+        _writes.put(None)  # Commits what is queued first
+        _writer.join()
+        _writer = None
+    _executor.shutdown(wait=True)
@@ -0,0 +1,279 @@
+# School catalog: canonical schools and their aliases, loaded from a CSV
+# file, with a trigram index for fuzzy matching what users type.
+#
+#   python schools.py [--dry-run]
+#
+# Run as a script, it re-canonicalizes the users table: every stored school
+# name that matches a catalog entry is rewritten to the canonical name and
+# gets its school_id, and one it no longer matches loses its school_id.
+# Run it after upgrading and whenever the catalog file changes.
+import argparse
+import asyncio
+import csv
+import heapq
+import logging
+import math
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+from operator import itemgetter
+
+from sqlalchemy import bindparam, func, select, update
+
+from config import Session
+from models import User
+
+logger = logging.getLogger(__name__)
+
+# CSV with id, name and aliases ("|"-separated) columns. IDs are stored in
+# users.school_id, so they must never be reused for another school.
+SCHOOL_CATALOG = os.getenv(
+    "SCHOOL_CATALOG", os.path.join(os.path.dirname(os.path.abspath(__file__)), "schools.csv")
+)
+SCHOOL_SUGGESTIONS = int(os.getenv("SCHOOL_SUGGESTIONS", "3"))
+# Trigram similarity (0-1) a catalog entry needs to be suggested, and to be
+# taken without asking when no other school comes close
+SCHOOL_MIN_SIMILARITY = float(os.getenv("SCHOOL_MIN_SIMILARITY", "0.3"))
+SCHOOL_MATCH_SIMILARITY = float(os.getenv("SCHOOL_MATCH_SIMILARITY", "0.8"))
+# Catalogs with more schools are matched on a matcher thread rather than
+# the event loop; a lookup takes about a millisecond at this size
+SCHOOL_INLINE_MAX = int(os.getenv("SCHOOL_INLINE_MAX", "1000"))
+SCHOOL_MATCH_WORKERS = int(os.getenv("SCHOOL_MATCH_WORKERS", "1"))
+RECANONICALIZE_CHUNK_SIZE = 500
+SCORE_SAMPLE = 64
+
+School = namedtuple("School", "id name")
+
+# Matching is CPU work that never touches the database, so it gets threads
+# of its own instead of taking a slot in the database pool
+_matcher = ThreadPoolExecutor(max_workers=SCHOOL_MATCH_WORKERS, thread_name_prefix="school")
+
+
+def normalize(name):
+    # "M.I.T." -> "mit", "École  Polytechnique" -> "ecole polytechnique"
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    text = "".join(char for char in decomposed if not unicodedata.combining(char))
+    text = re.sub(r"[.'’]", "", text)  # Abbreviation dots and apostrophes join letters
+    return " ".join(re.findall(r"\w+", text))
+
+
+def trigrams(text):
+    # pg_trgm style: each word padded with two spaces before and one after
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class SchoolCatalog:
+    # Every name and alias is an entry with its trigram set. An inverted
+    # index maps each trigram to the entries containing it. Similarity is
+    # the Jaccard index of the trigram sets, as in pg_trgm.
+    #
+    # A query only counts the postings of its rarest trigrams: an entry with
+    # similarity >= t shares at least t * len(query) trigrams, so it is in
+    # one of the len(query) - ceil(t * len(query)) + 1 rarest lists. t is
+    # raised from the minimum similarity to a lower bound on the final top
+    # matches, so common trigrams such as "uni" or " of" are rarely counted,
+    # and only entries whose count can still reach t are scored exactly.
+
+    def __init__(self, rows=()):
+        self._schools = {}  # id -> School
+        self._exact = {}  # normalized name or alias -> school id, None if ambiguous
+        self._entries = []  # (school id, trigram set)
+        self._postings = defaultdict(list)  # trigram -> entry indexes
+        for school_id, name, aliases in rows:
+            self._add(school_id, name, aliases)
+        self._postings = dict(self._postings)
+        self._sizes = [len(grams) for _, grams in self._entries]
+        self._max_size = max(self._sizes, default=0)
+
+    def _add(self, school_id, name, aliases):
+        if school_id in self._schools:
+            raise ValueError(f"Duplicate school id {school_id}")
+        self._schools[school_id] = School(school_id, name)
+        for text in {normalize(text) for text in [name, *aliases]}:
+            if not text:
+                continue
+            if self._exact.get(text, school_id) != school_id:
+                self._exact[text] = None
+            else:
+                self._exact[text] = school_id
+            grams = trigrams(text)
+            for gram in grams:
+                self._postings[gram].append(len(self._entries))
+            self._entries.append((school_id, frozenset(grams)))
+
+    @classmethod
+    def load(cls, path=SCHOOL_CATALOG):
+        if not os.path.exists(path):
+            logger.warning("No school catalog at %s; schools are stored as typed", path)
+            return cls()
+        with open(path, newline="", encoding="utf-8") as source:
+            rows = [
+                (
+                    int(row["id"]),
+                    row["name"].strip(),
+                    [alias.strip() for alias in (row.get("aliases") or "").split("|")],
+                )
+                for row in csv.DictReader(source)
+            ]
+        return cls(rows)
+
+    def __len__(self):
+        return len(self._schools)
+
+    def get(self, school_id):
+        return self._schools.get(school_id)
+
+    def _score(self, query, entries, best, threshold):
+        # Exact similarity of each entry; keeps the best one per school
+        for entry in entries:
+            school_id, grams = self._entries[entry]
+            shared = len(query & grams)
+            similarity = shared / (len(query) + len(grams) - shared)
+            if similarity >= threshold and similarity > best.get(school_id, 0):
+                best[school_id] = similarity
+
+    def suggest(self, text, limit=SCHOOL_SUGGESTIONS, min_similarity=SCHOOL_MIN_SIMILARITY):
+        # [(School, similarity)], best first, one entry per school
+        query = trigrams(normalize(text))
+        size = len(query)
+        if not size:
+            return []
+        postings = sorted((self._postings.get(gram, ()) for gram in query), key=len)
+        best = {}  # school id -> similarity
+        # The top matches among a few entries of the rarest trigrams bound the
+        # final top from below, which sets the bar for everything else
+        self._score(query, islice(chain.from_iterable(postings), SCORE_SAMPLE), best, min_similarity)
+        threshold = min_similarity
+        if len(best) >= limit:
+            threshold = max(threshold, heapq.nlargest(limit, best.values())[-1])
+        prefix = size - math.ceil(threshold * size) + 1
+        counts = Counter()
+        for entries in postings[:prefix]:
+            counts.update(entries)
+        # Similarity >= threshold needs threshold * (size + entry size) /
+        # (1 + threshold) shared trigrams; at most size - prefix of them are
+        # outside the counted prefix
+        needed = [
+            math.ceil(threshold * (size + entry_size) / (1 + threshold) - 1e-9) - (size - prefix)
+            for entry_size in range(self._max_size + 1)
+        ]
+        sizes = self._sizes
+        self._score(
+            query,
+            [entry for entry, count in counts.items() if count >= needed[sizes[entry]]],
+            best,
+            threshold,
+        )
+        top = heapq.nlargest(limit, best.items(), key=itemgetter(1))
+        return [(self._schools[school_id], similarity) for school_id, similarity in top]
+
+    def canonicalize(self, text):
+        # The catalog school for text, or None unless the match is
+        # unambiguous: an exact name or alias, or a single close match
+        school_id = self._exact.get(normalize(text))
+        if school_id is not None:
+            return self._schools[school_id]
+        matches = self.suggest(text, limit=2, min_similarity=SCHOOL_MATCH_SIMILARITY)
+        return matches[0][0] if len(matches) == 1 else None
+
+    def match(self, text):
+        # (School, []) when canonicalize() settles it, else (None, suggestions)
+        school = self.canonicalize(text)
+        return (school, []) if school is not None else (None, self.suggest(text))
+
+
+_catalog = None
+
+
+def catalog():
+    # Loaded on first use; the bot warms it up in post_init
+    global _catalog
+    if _catalog is None:
+        _catalog = SchoolCatalog.load()
+    return _catalog
+
+
+async def run_in_matcher(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_matcher, func, *args)
+
+
+def recanonicalize(schools, dry_run=False, chunk_size=RECANONICALIZE_CHUNK_SIZE):
+    # Rewrites stored school names the catalog recognizes, and clears the
+    # school_id of names it no longer does. Works on distinct values, so
+    # each is matched once, and commits chunk by chunk to keep write
+    # transactions short. The users triggers keep the search index and
+    # the registration counters in step. Returns (distinct values, values
+    # changed, rows updated).
+    session = Session()
+    try:
+        values = session.execute(
+            select(User.school, User.school_id, func.count())
+            .where(User.school.is_not(None))
+            .group_by(User.school, User.school_id)
+        ).all()
+        changes = {}  # stored value -> (canonical name, id), id None if unmatched
+        for raw, school_id, _ in values:
+            school = schools.canonicalize(raw)
+            if school is None:
+                if school_id is not None:
+                    changes[raw] = (raw, None)
+            elif raw != school.name or school_id != school.id:
+                changes[raw] = school.name, school.id
+        rows = sum(count for raw, _, count in values if raw in changes)
+        if not dry_run:
+            table = User.__table__
+            statement = (
+                update(table)
+                .where(table.c.school == bindparam("raw_school"))
+                .values(school=bindparam("canonical_name"), school_id=bindparam("canonical_id"))
+            )
+            items = list(changes.items())
+            for start in range(0, len(items), chunk_size):
+                session.execute(
+                    statement,
+                    [
+                        {"raw_school": raw, "canonical_name": name, "canonical_id": school_id}
+                        for raw, (name, school_id) in items[start : start + chunk_size]
+                    ],
+                )
+                session.commit()
+        return len({raw for raw, _, _ in values}), len(changes), rows
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        Session.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--catalog", default=SCHOOL_CATALOG)
+    parser.add_argument("--dry-run", action="store_true", help="count changes without writing them")
+    args = parser.parse_args()
+
+    from config import engine
+    from models import initialize_database
+
+    initialize_database(engine)
+    started = time.perf_counter()
+    schools = SchoolCatalog.load(args.catalog)
+    distinct, changed, rows = recanonicalize(schools, args.dry_run)
+    print(
+        f"{changed} of {distinct} school names {'would be' if args.dry_run else 'were'} "
+        f"canonicalized, {rows} rows ({time.perf_counter() - started:.1f}s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
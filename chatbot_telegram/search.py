@@ -0,0 +1,65 @@
+import os
+import re
+
+from sqlalchemy import or_, select, text
+
+from cache import UserSnapshot
+from config import Session
+from models import User
+
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "10"))
+# bm25 column weights (bio, school): a school match counts double
+BIO_WEIGHT = 1.0
+SCHOOL_WEIGHT = 2.0
+
+FTS_QUERY = text(
+    "SELECT users.chat_id, users.first_name, users.last_name, users.age, users.school, "
+    "users.email, users.bio, users.preference_code "
+    "FROM users_fts JOIN users ON users.chat_id = users_fts.rowid "
+    "WHERE users_fts MATCH :query "
+    f"ORDER BY bm25(users_fts, {BIO_WEIGHT}, {SCHOOL_WEIGHT}) "
+    "LIMIT :limit OFFSET :offset"
+)
+
+
+def search_terms(query):
+    # Words of the query, without FTS5 syntax; at most 8 are used
+    return re.findall(r"\w+", query.lower())[:8]
+
+
+def fts_query(terms):
+    # Every term must match, as a prefix, in the bio or the school:
+    # "miner robot" -> "miner"* "robot"*
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_users(query, page=1, page_size=SEARCH_PAGE_SIZE):
+    # Returns (UserSnapshots for the page, whether there is a next page),
+    # best matches first. Pages start at 1.
+    terms = search_terms(query)
+    if not terms:
+        return [], False
+    offset = (page - 1) * page_size
+    session = Session()
+    try:
+        if session.get_bind().dialect.name == "sqlite":
+            rows = session.execute(
+                FTS_QUERY,
+                {"query": fts_query(terms), "limit": page_size + 1, "offset": offset},
+            ).all()
+        else:
+            # No FTS5 index outside SQLite: unranked substring match
+            statement = select(User).order_by(User.chat_id)
+            for term in terms:
+                pattern = f"%{term}%"
+                statement = statement.where(
+                    or_(User.bio.ilike(pattern), User.school.ilike(pattern))
+                )
+            rows = session.scalars(statement.limit(page_size + 1).offset(offset)).all()
+        users = [
+            UserSnapshot.from_user(row) if isinstance(row, User) else UserSnapshot(*row)
+            for row in rows
+        ]
+        return users[:page_size], len(users) > page_size
+    finally:
+        Session.remove()
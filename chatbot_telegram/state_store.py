@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import operator
+import os
+import sys
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, fields
+
+from telegram.ext import ConversationHandler
+
+from constants import STATE_NAMES
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Conversations idle for longer than this are ended and their drafts dropped
+CONVERSATION_IDLE_TIMEOUT = float(os.getenv("CONVERSATION_IDLE_TIMEOUT", "86400"))
+# Hard cap on open conversations; the least recently active one goes first
+MAX_CONVERSATIONS = int(os.getenv("MAX_CONVERSATIONS", "100000"))
+STATE_SWEEP_INTERVAL = float(os.getenv("STATE_SWEEP_INTERVAL", "60"))
+STATS_SAMPLE = 1000
+
+
+@dataclass(slots=True)
+class Draft:
+    # context.user_data: the registration answers collected so far. Stored
+    # as the same JSON object as the plain dict it replaces.
+    first_name: str = None
+    last_name: str = None
+    email: str = None
+    age: int = None
+    school: str = None
+    school_id: int = None
+    preference_code: int = None
+    registering: bool = False
+
+    def to_dict(self):
+        # Only the fields that are set, so an empty draft is {}
+        return {
+            field.name: getattr(self, field.name)
+            for field in fields(self)
+            if getattr(self, field.name) not in (None, False)
+        }
+
+    def load(self, data):
+        # Fills fields that are still unset; unknown keys are ignored
+        for field in fields(self):
+            if getattr(self, field.name) in (None, False) and field.name in data:
+                setattr(self, field.name, data[field.name])
+
+    def size(self):
+        return sys.getsizeof(self) + sum(map(sys.getsizeof, _draft_values(self)))
+
+
+_draft_values = operator.attrgetter(*(field.name for field in fields(Draft)))
+
+
+class BoundedConversationHandler(ConversationHandler):
+    # A ConversationHandler whose open conversations are bounded. Every
+    # handled update moves its conversation to the end of an LRU order; a
+    # conversation is ended, and its draft dropped, when it has been idle
+    # for CONVERSATION_IDLE_TIMEOUT or when more than MAX_CONVERSATIONS are
+    # open. A conversation that ends normally drops its draft right away,
+    # so user_data only exists for conversations in progress.
+    #
+    # This replaces conversation_timeout, which needs PTB's JobQueue
+    # (APScheduler) and would schedule a job per update.
+
+    def __init__(
+        self,
+        *args,
+        idle_timeout=CONVERSATION_IDLE_TIMEOUT,
+        max_conversations=MAX_CONVERSATIONS,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.idle_timeout = idle_timeout
+        self.max_conversations = max_conversations
+        self._activity = OrderedDict()  # conversation key -> last update time
+        self._busy = Counter()  # user id -> updates being handled
+        self._open = Counter()  # user id -> open conversations
+        self._seen = set()  # user ids with an update since the last sweep
+        self._application = None
+        self._sweeper = None
+        self._stats = {}
+
+    async def handle_update(self, update, application, check_result, context):
+        key = check_result[1]
+        self._application = application
+        self._busy[key[-1]] += 1
+        try:
+            return await super().handle_update(update, application, check_result, context)
+        finally:
+            self._busy[key[-1]] -= 1
+            if not self._busy[key[-1]]:
+                del self._busy[key[-1]]
+            if key in self._conversations:
+                self._activity[key] = time.monotonic()
+                self._activity.move_to_end(key)
+                self._evict_over_capacity()
+            else:
+                self._activity.pop(key, None)
+                application.drop_user_data(key[-1])
+
+    def _evict_over_capacity(self):
+        # Least recently active first, passing over users with an update in
+        # flight: ending their conversation under a running handler would
+        # lose the state it is about to return
+        excess = len(self._activity) - self.max_conversations
+        if excess <= 0:
+            return
+        victims = []
+        for key in self._activity:
+            if key[-1] not in self._busy:
+                victims.append(key)
+                if len(victims) == excess:
+                    break
+        for key in victims:
+            self._evict(key, "capacity")
+
+    def _update_state(self, new_state, key, handler=None):
+        was_open = key in self._conversations
+        super()._update_state(new_state, key, handler)
+        is_open = key in self._conversations
+        if is_open and not was_open:
+            self._open[key[-1]] += 1
+        elif was_open and not is_open:
+            self._open[key[-1]] -= 1
+            if not self._open[key[-1]]:
+                del self._open[key[-1]]
+
+    async def track_user(self, update, context):
+        # Registered ahead of every other handler: any update with a user
+        # may leave a draft behind, and the sweep only looks at these
+        if update.effective_user is not None:
+            self._seen.add(update.effective_user.id)
+
+    def state(self, update):
+        # The state update's conversation is in before handling it, or None
+        return self._conversations.get(self._get_key(update))
+
+    def _evict(self, key, reason):
+        del self._activity[key]
+        self._update_state(self.END, key)
+        user_id = key[-1]
+        if self._application.user_data.get(user_id, Draft()).registering:
+            metrics.registrations.inc("abandoned")
+        self._application.drop_user_data(user_id)
+        metrics.conversations_evicted.inc(reason)
+
+    def start(self, application):
+        # Conversations restored from persistence count as active from now
+        self._application = application
+        now = time.monotonic()
+        for key in self._conversations:
+            self._activity.setdefault(key, now)
+            self._open[key[-1]] += 1
+        self._seen.update(application.user_data)
+        self._sweeper = asyncio.create_task(self._sweep_forever())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+
+    async def _sweep_forever(self):
+        while True:
+            await asyncio.sleep(STATE_SWEEP_INTERVAL)
+            self.sweep()
+
+    def sweep(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        expired = []
+        for key, last_active in self._activity.items():
+            if last_active > cutoff:
+                break
+            if key[-1] not in self._busy:
+                expired.append(key)
+        for key in expired:
+            self._evict(key, "idle")
+        if expired:
+            logger.info("Ended %d idle conversations", len(expired))
+        self._drop_idle_user_data()
+        self._stats = self._collect_stats()
+
+    def _drop_idle_user_data(self):
+        # PTB creates a draft for every user that sends any update (the flood
+        # guard's TypeHandler context loads it), but only users in a
+        # conversation, or with an update being handled, need one. Only the
+        # users seen since the last sweep can have gained a draft.
+        seen, self._seen = self._seen, set()
+        user_data = self._application.user_data
+        idle = []
+        for user_id in seen:
+            if user_id in self._busy:
+                self._seen.add(user_id)  # Check again once its update is done
+            elif user_id not in self._open and user_id in user_data:
+                idle.append(user_id)
+        for user_id in idle:
+            self._application.drop_user_data(user_id)
+        if idle:
+            logger.debug("Dropped %d drafts outside conversations", len(idle))
+
+    def _collect_stats(self):
+        # state name -> (open conversations, approximate bytes of their
+        # drafts). Sizes are measured on up to STATS_SAMPLE drafts per state
+        # and extrapolated, so a sweep stays cheap at the cap.
+        counts = Counter()
+        sampled = Counter()
+        user_data = self._application.user_data
+        for key, state in self._conversations.items():
+            name = STATE_NAMES.get(state, str(state))
+            counts[name] += 1
+            if counts[name] <= STATS_SAMPLE:
+                draft = user_data.get(key[-1])
+                sampled[name] += draft.size() if draft else 0
+        return {
+            name: (count, sampled[name] * count // min(count, STATS_SAMPLE))
+            for name, count in counts.items()
+        }
+
+    def stats(self):
+        # As of the last sweep, so reading it costs nothing
+        return self._stats
@@ -0,0 +1,172 @@
+# Registration statistics from the user_stats counters, and the job that
+# checks them against the users table.
+#
+#   python stats.py [--dry-run]
+#
+# The counters are maintained by triggers (see migrations.py), so reading
+# them costs the same whatever the number of users. The repair job counts
+# users in one streaming pass, reports every counter that drifted and,
+# unless --dry-run is given, corrects it.
+import argparse
+import datetime
+import sys
+import time
+from collections import Counter
+
+from sqlalchemy import select, text
+
+from config import Session
+from constants import AGE_BUCKET_OLDEST, AGE_BUCKETS
+from models import User, UserStat
+import repository
+
+STATS_CHUNK_SIZE = 10000
+STATS_DAYS = 7
+STATS_TOP_SCHOOLS = 10
+
+
+def age_bucket(age):
+    # Same buckets as migrations._age_bucket_sql
+    if age is None:
+        return "unknown"
+    for oldest, label in AGE_BUCKETS:
+        if age <= oldest:
+            return label
+    return AGE_BUCKET_OLDEST
+
+
+def count_users(connection, chunk_size=STATS_CHUNK_SIZE):
+    # (dimension, bucket) -> users, in one pass over the table
+    counts = Counter()
+    query = select(User.preference_code, User.school, User.age)
+    result = connection.execute(query.execution_options(yield_per=chunk_size))
+    for partition in result.partitions():
+        for preference_code, school, age in partition:
+            counts["preference", "" if preference_code is None else str(preference_code)] += 1
+            counts["school", school or ""] += 1
+            counts["age", age_bucket(age)] += 1
+        counts["total", ""] += len(partition)
+    return counts
+
+
+def _stored_counts(connection):
+    rows = connection.execute(
+        select(UserStat.dimension, UserStat.bucket, UserStat.count).where(
+            UserStat.dimension != "day"
+        )
+    )
+    return {(dimension, bucket): count for dimension, bucket, count in rows if count}
+
+
+def read_stats(days=STATS_DAYS, top_schools=STATS_TOP_SCHOOLS):
+    # {"total": n, "preference": {code: n}, "age": {label: n},
+    #  "schools": [(school, n)], "days": [(date, n)]}
+    session = Session()
+    try:
+        if session.get_bind().dialect.name == "sqlite":
+            since = datetime.datetime.utcnow().date() - datetime.timedelta(days=days - 1)
+            counts = {
+                (dimension, bucket): count
+                for dimension, bucket, count in session.execute(
+                    select(UserStat.dimension, UserStat.bucket, UserStat.count).where(
+                        UserStat.dimension.in_(["total", "preference", "age"])
+                    )
+                )
+            }
+            schools = session.execute(
+                select(UserStat.bucket, UserStat.count)
+                .where(UserStat.dimension == "school", UserStat.count > 0)
+                .order_by(UserStat.count.desc())
+                .limit(top_schools)
+            ).all()
+            day_counts = session.execute(
+                select(UserStat.bucket, UserStat.count)
+                .where(UserStat.dimension == "day", UserStat.bucket >= since.isoformat())
+                .order_by(UserStat.bucket)
+            ).all()
+        else:
+            # No counter triggers outside SQLite, so count the table instead
+            counts = count_users(session)
+            schools = sorted(
+                ((bucket, n) for (dimension, bucket), n in counts.items() if dimension == "school"),
+                key=lambda school: -school[1],
+            )[:top_schools]
+            day_counts = []
+        return {
+            "total": counts.get(("total", ""), 0),
+            "preference": {
+                bucket: n for (dimension, bucket), n in counts.items() if dimension == "preference" and n
+            },
+            "age": {bucket: n for (dimension, bucket), n in counts.items() if dimension == "age" and n},
+            "schools": [tuple(row) for row in schools],
+            "days": [tuple(row) for row in day_counts],
+        }
+    finally:
+        Session.remove()
+
+
+def repair_stats(fix=True):
+    # Returns the drifted counters as (dimension, bucket, stored, actual).
+    # The users pass and the counters are read in one transaction, so they
+    # are a consistent snapshot; WAL readers do not block the bot's writes.
+    # Corrections are applied as deltas, which stays right if users change
+    # in the meantime. Day counters have no source to check against.
+    session = Session()
+    try:
+        connection = session.connection()
+        if connection.dialect.name != "sqlite":
+            return []  # Nothing to repair: the counters are only kept on SQLite
+        connection.exec_driver_sql("BEGIN")
+        actual = count_users(connection)
+        stored = _stored_counts(connection)
+        session.rollback()
+        drift = sorted(
+            (*key, stored.get(key, 0), actual.get(key, 0))
+            for key in stored.keys() | actual.keys()
+            if stored.get(key, 0) != actual.get(key, 0)
+        )
+        if fix and drift:
+            statement = repository.insert(UserStat, connection)
+            statement = statement.on_conflict_do_update(
+                index_elements=[UserStat.dimension, UserStat.bucket],
+                set_={"count": UserStat.count + statement.excluded.count},
+            )
+            session.execute(
+                statement,
+                [
+                    {"dimension": dimension, "bucket": bucket, "count": correct - count}
+                    for dimension, bucket, count, correct in drift
+                ],
+            )
+            session.execute(text("DELETE FROM user_stats WHERE count = 0 AND dimension != 'day'"))
+            session.commit()
+        return drift
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        Session.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true", help="report drift without fixing it")
+    args = parser.parse_args()
+
+    from config import engine
+    from models import initialize_database
+
+    initialize_database(engine)
+    started = time.perf_counter()
+    drift = repair_stats(fix=not args.dry_run)
+    for dimension, bucket, stored, actual in drift:
+        print(f"{dimension} {bucket!r}: counter {stored}, actual {actual}")
+    print(
+        f"{len(drift)} counters drifted{'' if args.dry_run or not drift else ', fixed'} "
+        f"({time.perf_counter() - started:.1f}s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
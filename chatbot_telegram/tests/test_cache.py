@@ -0,0 +1,80 @@
+import asyncio
+import threading
+
+import repository
+from cache import ProfileCache, UserSnapshot
+
+PROFILE = dict(
+    first_name="Ada",
+    last_name="Lovelace",
+    age=17,
+    school="Minerva University",
+    email="ada@example.com",
+    bio="I like maths.",
+    preference_code=2,
+)
+
+
+def snapshot(chat_id, **changes):
+    return UserSnapshot(chat_id=chat_id, **{**PROFILE, **changes})
+
+
+def test_put_from_before_an_invalidation_is_ignored():
+    cache = ProfileCache()
+    generation = cache.generation()
+    cache.invalidate(1)
+    cache.put(1, snapshot(1), generation)
+    assert cache.get(1) is None
+
+    cache.put(1, snapshot(1), cache.generation())
+    assert cache.get(1) == snapshot(1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ProfileCache(max_size=2)
+    for chat_id in (1, 2):
+        cache.put(chat_id, snapshot(chat_id), cache.generation())
+    cache.get(1)
+    cache.put(3, snapshot(3), cache.generation())
+    assert cache.get(2) is None
+    assert cache.get(1) is not None and cache.get(3) is not None
+    assert cache.evictions == 1
+
+
+def test_get_user_sees_update_field(database):
+    async def scenario():
+        await repository.upsert_user(1, **PROFILE)
+        before = await repository.get_user(1)  # Now cached
+        assert await repository.update_field(1, "school", "MIT")
+        return before, await repository.get_user(1)
+
+    before, after = asyncio.run(scenario())
+    assert before.school == "Minerva University"
+    assert after.school == "MIT"
+
+
+def test_load_racing_a_write_is_not_cached(database, monkeypatch):
+    # A read that started before update_field() and finishes after it must
+    # not put its stale row in the cache
+    loaded, release = threading.Event(), threading.Event()
+    get_user = repository._get_user
+
+    def slow_get_user(chat_id):
+        user = get_user(chat_id)
+        loaded.set()
+        release.wait(5)
+        return user
+
+    async def scenario():
+        await repository.upsert_user(1, **PROFILE)
+        monkeypatch.setattr(repository, "_get_user", slow_get_user)
+        reader = asyncio.create_task(repository.get_user(1))
+        await asyncio.to_thread(loaded.wait, 5)
+        monkeypatch.setattr(repository, "_get_user", get_user)
+        await repository.update_field(1, "school", "MIT")
+        release.set()
+        return await reader, await repository.get_user(1)
+
+    stale, fresh = asyncio.run(scenario())
+    assert stale.school == "Minerva University"
+    assert fresh.school == "MIT"
@@ -0,0 +1,56 @@
+import asyncio
+from types import SimpleNamespace
+
+from telegram.error import BadRequest
+from telegram.ext import ApplicationHandlerStop
+
+from flood_guard import FloodGuard
+
+
+class FakeQuery:
+    def __init__(self, data, error=None):
+        self.data = data
+        self.error = error
+        self.answered = 0
+
+    async def answer(self):
+        self.answered += 1
+        if self.error:
+            raise self.error
+
+
+def button_press(data, error=None):
+    return SimpleNamespace(
+        effective_chat=SimpleNamespace(id=1),
+        callback_query=FakeQuery(data, error),
+        message=None,
+    )
+
+
+def check(guard, update):
+    try:
+        asyncio.run(guard.check(update, None))
+    except ApplicationHandlerStop:
+        return False
+    return True
+
+
+def test_dropped_button_presses_are_answered_once_per_refill():
+    guard = FloodGuard(rate=0.001, burst=1, duplicate_window=0)
+    presses = [button_press(f"choice:{i}") for i in range(3)]
+    assert [check(guard, press) for press in presses] == [True, False, False]
+    assert [press.callback_query.answered for press in presses] == [0, 1, 0]
+
+
+def test_duplicate_button_press_is_answered_and_dropped():
+    guard = FloodGuard(rate=1, burst=5, duplicate_window=60)
+    first, again = button_press("choice:1"), button_press("choice:1")
+    assert check(guard, first)
+    assert not check(guard, again)
+    assert again.callback_query.answered == 1
+
+
+def test_failed_answer_still_drops_the_update():
+    guard = FloodGuard(rate=1, burst=5, duplicate_window=60)
+    assert check(guard, button_press("choice:1"))
+    assert not check(guard, button_press("choice:1", BadRequest("Query is too old")))
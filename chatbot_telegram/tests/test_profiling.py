@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from profiling import StatementTimer
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    yield engine
+    engine.dispose()
+
+
+def test_statement_timer_totals_queries(engine):
+    timer = StatementTimer(engine)
+    timer.start()
+    with engine.connect() as connection:
+        for _ in range(3):
+            connection.execute(text("SELECT 1"))
+    timer.stop()
+    assert timer.totals["SELECT 1"][0] == 3
+
+
+def test_statement_running_at_start_is_skipped(engine):
+    # after_cursor_execute without a start time, as for a statement that
+    # was already running when the profile started
+    timer = StatementTimer(engine)
+    with engine.connect() as connection:
+        timer._after(connection, None, "SELECT 1", (), None, False)
+    assert not timer.totals
+
+
+def test_failed_statement_leaves_no_start_time(engine):
+    timer = StatementTimer(engine)
+    timer.start()
+    with engine.connect() as connection:
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM missing"))
+        assert not connection.info.get(timer._key)
+        connection.execute(text("SELECT 2"))
+    timer.stop()
+    assert timer.totals["SELECT 2"][0] == 1
+
+
+def test_start_times_left_by_stop_do_not_reach_the_next_timer(engine):
+    first, second = StatementTimer(engine), StatementTimer(engine)
+    with engine.connect() as connection:
+        # Stopped between before and after: the start time stays behind
+        first._before(connection, None, "SELECT 1", (), None, False)
+        second._after(connection, None, "SELECT 1", (), None, False)
+    assert not second.totals
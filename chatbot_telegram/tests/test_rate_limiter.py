@@ -0,0 +1,41 @@
+import asyncio
+
+from rate_limiter import BULK, TokenBucketRateLimiter
+
+
+async def ok():
+    return True
+
+
+def send(limiter, chat_id, rate_limit_args=None, endpoint="sendMessage"):
+    return limiter.process_request(
+        ok, (), {}, endpoint, {"chat_id": chat_id}, rate_limit_args
+    )
+
+
+def test_bulk_sends_leave_the_reply_share_of_the_global_bucket():
+    async def scenario():
+        limiter = TokenBucketRateLimiter(global_rate=10, chat_burst=1, reply_share=0.4)
+        for chat_id in range(6):
+            await send(limiter, chat_id, BULK)
+        assert limiter.throttled == 0
+        bulk = asyncio.create_task(send(limiter, 6, BULK))
+        await asyncio.sleep(0.01)
+        assert not bulk.done()  # The bulk bucket is empty
+        for chat_id in range(100, 104):
+            await send(limiter, chat_id)
+        assert limiter.throttled == 1  # Replies went through at once
+        await bulk
+
+    asyncio.run(scenario())
+
+
+def test_answering_a_callback_query_skips_the_chat_bucket():
+    async def scenario():
+        limiter = TokenBucketRateLimiter(chat_rate=0.001, chat_burst=1)
+        await send(limiter, 1)
+        for _ in range(3):
+            await send(limiter, 1, endpoint="answerCallbackQuery")
+        assert limiter.throttled == 0
+
+    asyncio.run(scenario())
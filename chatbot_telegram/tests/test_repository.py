@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy import create_mock_engine
+
+import repository
+from models import User
+
+
+@pytest.mark.parametrize("url", ["sqlite://", "postgresql://"])
+def test_insert_builds_on_conflict_for_the_bound_dialect(url):
+    engine = create_mock_engine(url, executor=None)
+    statement = repository.insert(User.__table__, engine)
+    statement = statement.on_conflict_do_update(
+        index_elements=["chat_id"], set_={"age": statement.excluded.age}
+    )
+    sql = str(statement.compile(dialect=engine.dialect))
+    assert "ON CONFLICT (chat_id) DO UPDATE SET age = excluded.age" in sql
+
+
+def test_insert_rejects_dialects_without_on_conflict():
+    with pytest.raises(NotImplementedError):
+        repository.insert(User.__table__, create_mock_engine("mysql://", executor=None))
+
+
+def test_upsert_overwrites_an_existing_profile(database):
+    repository.execute_writes([repository.upsert_statement(1, first_name="Ada", age=17)])
+    repository.execute_writes([repository.upsert_statement(1, age=18)])
+    with database.connect() as connection:
+        row = connection.execute(User.__table__.select()).one()
+    assert (row.chat_id, row.first_name, row.age) == (1, "Ada", 18)
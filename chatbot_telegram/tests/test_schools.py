@@ -0,0 +1,51 @@
+import asyncio
+import threading
+
+from sqlalchemy import select
+
+import schools
+from models import User
+from schools import SchoolCatalog, recanonicalize
+
+CATALOG = SchoolCatalog(
+    [(1, "Massachusetts Institute of Technology", ["MIT"]), (2, "Minerva University", [])]
+)
+
+
+def test_recanonicalize_rewrites_known_names_and_clears_stale_ids(database):
+    with database.begin() as connection:
+        connection.execute(
+            User.__table__.insert(),
+            [
+                {"chat_id": 1, "school": "M.I.T.", "school_id": None},
+                {"chat_id": 2, "school": "Closed College", "school_id": 3},
+                {"chat_id": 3, "school": "Minerva University", "school_id": 2},
+                {"chat_id": 4, "school": "Unknown School", "school_id": None},
+            ],
+        )
+
+    assert recanonicalize(CATALOG) == (4, 2, 2)
+
+    with database.connect() as connection:
+        rows = connection.execute(
+            select(User.chat_id, User.school, User.school_id).order_by(User.chat_id)
+        ).all()
+    assert [tuple(row) for row in rows] == [
+        (1, "Massachusetts Institute of Technology", 1),
+        (2, "Closed College", None),
+        (3, "Minerva University", 2),
+        (4, "Unknown School", None),
+    ]
+
+
+def test_matching_runs_outside_the_database_pool():
+    async def scenario():
+        return await asyncio.gather(
+            schools.run_in_matcher(CATALOG.match, "mit"),
+            schools.run_in_matcher(lambda: threading.current_thread().name),
+        )
+
+    (school, candidates), thread = asyncio.run(scenario())
+    assert school == schools.School(1, "Massachusetts Institute of Technology")
+    assert candidates == []
+    assert thread.startswith("school")
@@ -0,0 +1,88 @@
+import asyncio
+import datetime
+
+import telegram
+from telegram import Chat, Message, Update, User
+from telegram.ext import CommandHandler
+
+from state_store import BoundedConversationHandler, Draft
+
+ASKED = 1
+
+
+class FakeApplication:
+    def __init__(self):
+        self.user_data = {}
+
+    def drop_user_data(self, user_id):
+        self.user_data.pop(user_id, None)
+
+
+def conversation(**kwargs):
+    async def start(update, context):
+        return ASKED
+
+    handler = BoundedConversationHandler(
+        entry_points=[CommandHandler("start", start)],
+        states={ASKED: [CommandHandler("start", start)]},
+        fallbacks=[],
+        **kwargs,
+    )
+    handler._application = FakeApplication()
+    return handler
+
+
+def update_from(user_id):
+    user = User(user_id, "Ada", is_bot=False)
+    chat = Chat(user_id, Chat.PRIVATE)
+    message = Message(1, datetime.datetime.now(), chat, from_user=user, text="/start")
+    return Update(1, message=message)
+
+
+def test_python_telegram_bot_internals_are_as_expected():
+    # BoundedConversationHandler reads and writes these private members of
+    # ConversationHandler; requirements.txt pins the version they match
+    assert telegram.__version__ == "20.8"
+    handler = conversation()
+    key = handler._get_key(update_from(7))
+    assert key == (7, 7)
+    assert handler._conversations == {}
+
+    handler._update_state(ASKED, key)
+    assert handler._conversations == {key: ASKED}
+    assert handler.state(update_from(7)) == ASKED
+    handler._update_state(handler.END, key)
+    assert handler._conversations == {}
+    assert not handler._open
+
+
+def test_capacity_eviction_skips_users_with_an_update_in_flight():
+    handler = conversation(max_conversations=2)
+    for user_id in (1, 2, 3):
+        key = (user_id, user_id)
+        handler._update_state(ASKED, key)
+        handler._activity[key] = user_id
+        handler._application.user_data[user_id] = Draft()
+    handler._busy[1] += 1
+
+    handler._evict_over_capacity()
+    assert list(handler._conversations) == [(1, 1), (3, 3)]
+    assert 2 not in handler._application.user_data
+    assert 1 in handler._application.user_data
+
+
+def test_sweep_drops_only_drafts_of_seen_users_outside_conversations():
+    handler = conversation()
+    handler._update_state(ASKED, (1, 1))
+    handler._activity[(1, 1)] = float("inf")
+    for user_id in (1, 2, 3):
+        handler._application.user_data[user_id] = Draft()
+        asyncio.run(handler.track_user(update_from(user_id), None))
+    handler._busy[3] += 1
+
+    handler.sweep()
+    assert sorted(handler._application.user_data) == [1, 3]
+
+    del handler._busy[3]
+    handler.sweep()
+    assert sorted(handler._application.user_data) == [1]
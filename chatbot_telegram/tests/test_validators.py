@@ -0,0 +1,39 @@
+import pytest
+
+from import_users import validate
+from validators import parse_age, parse_preference
+
+ROW = {
+    "chat_id": "42",
+    "first_name": "ada",
+    "last_name": "lovelace",
+    "age": "17",
+    "school": "",
+    "email": "ada@example.com",
+    "bio": "",
+    "preferences": "2",
+}
+
+
+@pytest.mark.parametrize("text, age", [("17", 17), ("", None), ("-3", None), ("17.5", None)])
+def test_parse_age(text, age):
+    assert parse_age(text) == age
+
+
+# Digits that str.isdigit() accepts but int() rejects
+@pytest.mark.parametrize("text", ["²", "①", "1²"])
+def test_digit_characters_are_rejected(text):
+    assert parse_age(text) is None
+    assert parse_preference(text) is None
+
+
+def test_parse_preference():
+    assert parse_preference("2") == 2
+    assert parse_preference("99") is None
+
+
+def test_import_rejects_digit_characters():
+    assert validate({**ROW, "age": "①"}) == (None, "invalid age")
+    assert validate({**ROW, "preferences": "²"}) == (None, "invalid preference")
+    assert validate({**ROW, "chat_id": "4²"}) == (None, "invalid chat_id")
+    assert validate(ROW)[1] is None
@@ -0,0 +1,27 @@
+import asyncio
+
+from sqlalchemy import text
+
+import repository
+from write_behind import WriteBehindQueue
+
+
+def test_failing_statement_only_fails_its_own_submit(database):
+    async def scenario():
+        queue = WriteBehindQueue(flush_interval_ms=50)
+        queue.start()
+        results = await asyncio.gather(
+            queue.submit(repository.upsert_statement(1, first_name="Ada")),
+            queue.submit((text("INSERT INTO missing_table VALUES (1)"), {})),
+            queue.submit(repository.upsert_statement(2, first_name="Grace")),
+            return_exceptions=True,
+        )
+        await queue.stop()
+        return queue, results
+
+    queue, results = asyncio.run(scenario())
+    assert results[0] == 1 and results[2] == 1
+    assert "missing_table" in str(results[1])
+    assert queue.batches == 1 and queue.rows == 3 and queue.failed == 1
+    assert asyncio.run(repository.get_user(1)).first_name == "Ada"
+    assert asyncio.run(repository.get_user(2)).first_name == "Grace"
@@ -0,0 +1,82 @@
+import asyncio
+import os
+
+from telegram.ext import BaseUpdateProcessor
+
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+UNBOUNDED_UPDATES = 2**31 - 1
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    # Processes updates from different chats concurrently while keeping the
+    # updates of any single chat strictly in arrival order, which the
+    # ConversationHandler state machine relies on.
+    #
+    # An update first waits for its chat's lock and only then takes one of
+    # the concurrency slots, so a chat with a backlog never holds slots that
+    # other chats could use. The slots are our own semaphore: the base
+    # class takes its semaphore before do_process_update, so it gets a limit
+    # that never binds.
+
+    def __init__(self, max_concurrent_updates=UPDATE_CONCURRENCY):
+        if max_concurrent_updates < 1:
+            raise ValueError("max_concurrent_updates must be a positive integer")
+        super().__init__(UNBOUNDED_UPDATES)
+        self._slots = asyncio.Semaphore(max_concurrent_updates)
+        self._chat_locks = {}  # chat key -> [lock, number of queued updates]
+        self.waiting = 0  # Updates queued behind another update of their chat
+        self.running = 0
+        self.processed = 0
+        self.max_chat_depth = 0
+
+    @staticmethod
+    def _chat_key(update):
+        chat = getattr(update, "effective_chat", None)
+        if chat is not None:
+            return chat.id
+        user = getattr(update, "effective_user", None)
+        return ("user", user.id) if user is not None else None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._chat_key(update)
+        if key is None:
+            return await self._run(coroutine)
+
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        self.max_chat_depth = max(self.max_chat_depth, entry[1])
+        self.waiting += 1
+        try:
+            async with entry[0]:
+                self.waiting -= 1
+                await self._run(coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[key]
+
+    async def _run(self, coroutine):
+        async with self._slots:
+            self.running += 1
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+                self.processed += 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "waiting": self.waiting,
+            "active_chats": len(self._chat_locks),
+            "processed": self.processed,
+            "max_chat_depth": self.max_chat_depth,
+        }
@@ -0,0 +1,14 @@
+from constants import PREFERENCE_OPTIONS
+
+
+# Shared by the conversation handlers and the bulk importer, so a profile is
+# accepted by the same rules whichever way it arrives.
+def parse_age(text):
+    return int(text) if text.isdecimal() else None
+
+
+def parse_preference(text):
+    # Accepts the option number ("2"); returns its code or None
+    if text.isdecimal() and int(text) in PREFERENCE_OPTIONS:
+        return int(text)
+    return None
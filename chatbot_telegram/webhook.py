@@ -0,0 +1,117 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+import secrets
+
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Public URL registered with Telegram
+# Telegram sends it with every update. Required unless WEBHOOK_URL is set,
+# in which case a random one is registered on each start.
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))
+WEBHOOK_MAX_BODY = 1024 * 1024
+
+
+class WebhookApp:
+    # ASGI app that receives Telegram updates. Each request is checked,
+    # parsed and put on the Application's bounded update queue, then
+    # acknowledged right away; handlers run later. When the queue is full
+    # the request gets a 503 so Telegram retries it later. Requests without
+    # the secret token are refused: anyone who can reach the port could
+    # otherwise post updates with any chat id, including an admin's.
+
+    def __init__(self, application, path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET):
+        if not secret_token:
+            raise ValueError("A webhook secret token is required")
+        self.application = application
+        self.path = path
+        self.secret_token = secret_token.encode()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        if scope["path"] != self.path:
+            return await self._respond(send, 404)
+        if scope["method"] != "POST":
+            return await self._respond(send, 405)
+        headers = dict(scope["headers"])
+        if not hmac.compare_digest(
+            headers.get(b"x-telegram-bot-api-secret-token", b""), self.secret_token
+        ):
+            return await self._respond(send, 403)
+
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if len(body) > WEBHOOK_MAX_BODY:
+                return await self._respond(send, 413)
+
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, TypeError, KeyError):
+            logger.warning("Rejected malformed webhook payload")
+            return await self._respond(send, 400)
+        try:
+            self.application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return await self._respond(send, 503)
+        await self._respond(send, 200)
+
+    @staticmethod
+    async def _respond(send, status):
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [(b"content-length", b"0")],
+            }
+        )
+        await send({"type": "http.response.body", "body": b""})
+
+
+async def serve(application):
+    # Runs the Application without an Updater and feeds it from the embedded
+    # HTTP server until the server is stopped (Ctrl+C / SIGTERM).
+    import uvicorn
+
+    secret_token = WEBHOOK_SECRET
+    if not secret_token:
+        if not WEBHOOK_URL:
+            raise RuntimeError(
+                "Set WEBHOOK_SECRET to the secret registered with Telegram, "
+                "or WEBHOOK_URL to register the webhook with a generated one"
+            )
+        secret_token = secrets.token_urlsafe(32)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    if WEBHOOK_URL:
+        await application.bot.set_webhook(url=WEBHOOK_URL, secret_token=secret_token)
+    await application.start()
+    config = uvicorn.Config(
+        WebhookApp(application, secret_token=secret_token),
+        host=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        lifespan="off",
+        log_level="warning",
+    )
+    try:
+        await uvicorn.Server(config).serve()
+    finally:
+        await application.stop()
+        if application.post_stop:
+            await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
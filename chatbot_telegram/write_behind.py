@@ -0,0 +1,120 @@
+import asyncio
+import logging
+import os
+import time
+
+import repository
+
+logger = logging.getLogger(__name__)
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND", "0") == "1"
+FLUSH_INTERVAL_MS = int(os.getenv("WRITE_BEHIND_INTERVAL_MS", "20"))
+MAX_BATCH_ROWS = int(os.getenv("WRITE_BEHIND_BATCH", "200"))
+MAX_PENDING = int(os.getenv("WRITE_BEHIND_QUEUE", "2000"))
+
+
+class WriteBehindQueue:
+    # Collects write statements from many handlers and commits them together,
+    # trading one fsync per message for one per batch. submit() resolves only
+    # after the batch holding the statement is committed, so handlers still
+    # reply after their data is durable.
+
+    def __init__(
+        self,
+        flush_interval_ms=FLUSH_INTERVAL_MS,
+        max_batch_rows=MAX_BATCH_ROWS,
+        max_pending=MAX_PENDING,
+    ):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch_rows = max_batch_rows
+        # A full queue makes submit() wait, which pushes back on the handlers
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._task = None
+        self.batches = 0
+        self.rows = 0
+        self.max_batch_size = 0
+        self.flush_seconds_total = 0.0
+        self.max_flush_seconds = 0.0
+        self.failed = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def pending(self):
+        return self._queue.qsize()
+
+    async def submit(self, statement):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((statement, future))
+        return await future
+
+    async def stop(self):
+        # Flushes everything already queued, then stops the worker
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info(
+            "Write-behind flushed %d rows in %d batches (max batch %d, max flush %.1fms)",
+            self.rows,
+            self.batches,
+            self.max_batch_size,
+            self.max_flush_seconds * 1000,
+        )
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch_rows:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        statements = [statement for statement, _ in batch]
+        started = time.perf_counter()
+        try:
+            rowcounts = await repository.run_writes(statements)
+        except Exception:
+            # One bad statement rolls back the whole batch; replay the batch
+            # one statement per transaction so only that submit() fails
+            logger.warning("Write-behind batch of %d failed, retrying one by one", len(batch))
+            await self._flush_each(batch)
+            return
+        finally:
+            elapsed = time.perf_counter() - started
+            self.batches += 1
+            self.rows += len(batch)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+            self.flush_seconds_total += elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        for (_, future), rowcount in zip(batch, rowcounts):
+            if not future.done():
+                future.set_result(rowcount)
+
+    async def _flush_each(self, batch):
+        for statement, future in batch:
+            try:
+                (rowcount,) = await repository.run_writes([statement])
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            else:
+                if not future.done():
+                    future.set_result(rowcount)